@@ -1,34 +1,72 @@
+import click
 from config import Config
 from flask import Flask
+from flask.cli import ScriptInfo
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_login import LoginManager
 from flask_mail import Mail
-from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
+
+from .staticfiles import Assets
+from .caching import Cache
+from .database import SQLAlchemy
+from .instrumentation import Metrics
 
 db = SQLAlchemy()
 cors = CORS()
 bcrypt = Bcrypt()
-migrate = Migrate()
 login_manager = LoginManager()
 mail = Mail()
+cache = Cache()
+metrics = Metrics()
+assets = Assets()
 login_manager.login_view = "login"
 login_manager.login_message_category = "danger-alert"
 
 
 def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
 
     db.init_app(app)
     cors.init_app(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
     mail.init_app(app)
+    cache.init_app(app)
+    metrics.init_app(app)
+    assets.init_app(app)
 
     with app.app_context():
-        from . import models, routes
+        from . import models, outbox, routes
+
+        if _loaded_by_cli():
+            _init_cli(app)
+        if app.config["MAIL_OUTBOX_THREAD"]:
+            outbox.start_worker(app)
 
         return app
+
+
+def _loaded_by_cli():
+    # The flask command creates the app inside one of its click contexts,
+    # which carry its ScriptInfo; a WSGI server, even one started from its
+    # own click command, does not. "flask run" serves the app and needs none
+    # of the maintenance commands either.
+    ctx = click.get_current_context(silent=True)
+    if ctx is None or ctx.find_object(ScriptInfo) is None:
+        return False
+    return ctx.info_name != "run"
+
+
+def _init_cli(app):
+    """Set up what only the flask command uses.
+
+    Migrations pull in Alembic, which takes longer to import than the rest of
+    the app, and every web worker would otherwise load it for nothing.
+    """
+    from flask_migrate import Migrate
+
+    from . import commands  # noqa: F401
+
+    Migrate(app, db, render_as_batch=True)
@@ -0,0 +1,224 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.utils import import_string
+
+
+class SimpleCache:
+    """In-process LRU cache with per-entry expiry."""
+
+    # Each worker process has its own copy.
+    shared = False
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.monotonic() + timeout if timeout else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCache:
+    """Pickled entries in a directory, shared by every process on the host."""
+
+    shared = True
+
+    def __init__(self, directory, default_timeout=300):
+        self.directory = directory
+        self.default_timeout = default_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(
+            self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest()
+        )
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.time() + timeout if timeout else 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class RedisCache:
+    """Cache on any server speaking the Redis protocol."""
+
+    shared = True
+
+    def __init__(self, client, prefix="devwrites:", default_timeout=300):
+        self.client = client
+        self.prefix = prefix
+        self.default_timeout = default_timeout
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.client.set(self.prefix + key, data, ex=timeout or None)
+
+    def get_many(self, *keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [None if value is None else pickle.loads(value) for value in values]
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def _redis_backend(app):
+    import redis
+
+    return RedisCache(
+        redis.Redis.from_url(app.config["CACHE_REDIS_URL"]),
+        default_timeout=app.config["CACHE_DEFAULT_TIMEOUT"],
+    )
+
+
+BACKENDS = {
+    "simple": lambda app: SimpleCache(
+        max_entries=app.config["CACHE_MAX_ENTRIES"],
+        default_timeout=app.config["CACHE_DEFAULT_TIMEOUT"],
+    ),
+    "filesystem": lambda app: FileSystemCache(
+        app.config["CACHE_DIR"],
+        default_timeout=app.config["CACHE_DEFAULT_TIMEOUT"],
+    ),
+    "redis": _redis_backend,
+}
+
+
+class Cache:
+    """Flask extension fronting a pluggable cache backend.
+
+    ``CACHE_TYPE`` names one of the built-in backends or gives the import path
+    of a factory taking the app, so a shared store can be dropped in without
+    touching the callers. Backends only need ``get``, ``set``, ``delete`` and
+    ``clear``, and a ``shared`` attribute set to False if each process
+    gets its own store, which is refused when ``WEB_CONCURRENCY`` says
+    several worker processes serve the app.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_TYPE", "simple")
+        app.config.setdefault("WEB_CONCURRENCY", 1)
+        app.config.setdefault("CACHE_MAX_ENTRIES", 1024)
+        app.config.setdefault("CACHE_DEFAULT_TIMEOUT", 300)
+        app.config.setdefault(
+            "CACHE_DIR", os.path.join(tempfile.gettempdir(), "devwrites-cache")
+        )
+        app.config.setdefault("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        factory = app.config["CACHE_TYPE"]
+        if isinstance(factory, str):
+            factory = BACKENDS.get(factory) or import_string(factory)
+        self.backend = factory(app)
+        # Version tokens (see pagecache) only invalidate entries for every
+        # worker if all of them read the same store.
+        if app.config["WEB_CONCURRENCY"] > 1 and not getattr(
+            self.backend, "shared", True
+        ):
+            raise RuntimeError(
+                f"CACHE_TYPE {app.config['CACHE_TYPE']!r} is private to one "
+                f"process but WEB_CONCURRENCY is {app.config['WEB_CONCURRENCY']}; "
+                "use a shared backend such as 'filesystem' or 'redis'"
+            )
+        app.extensions["cache"] = self
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def get_many(self, *keys):
+        """Values for ``keys``, in one round-trip if the backend can."""
+        get_many = getattr(self.backend, "get_many", None)
+        if get_many is not None:
+            return get_many(*keys)
+        return [self.backend.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_or_set(self, key, compute, timeout=None):
+        value = self.backend.get(key)
+        if value is None:
+            value = compute()
+            self.backend.set(key, value, timeout)
+        return value
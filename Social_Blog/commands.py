@@ -0,0 +1,194 @@
+import click
+from flask import current_app as app
+
+from . import (db, deletion, images, outbox, queryplans, search, syndication,
+               timeline, transfer)
+from .models import Post, User
+from .staticfiles import build as build_assets
+
+
+@app.cli.group("assets")
+def assets_cli():
+    """Build the fingerprinted, precompressed static assets."""
+
+
+@assets_cli.command("build")
+def assets_build():
+    """Fingerprint and compress the stylesheets and scripts into static/dist."""
+    dist = app.config["ASSETS_DIST"]
+    manifest = build_assets(app.static_folder, dist)
+    click.echo(f"Built {len(manifest)} asset(s) into {dist}")
+
+
+@app.cli.group("timeline")
+def timeline_cli():
+    """Maintain the materialized followed-feed timeline."""
+
+
+@timeline_cli.command("rebuild")
+def timeline_rebuild():
+    """Repopulate every inbox from the follows and posts tables."""
+    timeline.rebuild()
+    click.echo("Timeline rebuilt")
+
+
+@app.cli.group("images")
+def images_cli():
+    """Manage the background image processing queue."""
+
+
+@images_cli.command("resume")
+def images_resume():
+    """Resubmit jobs left pending by a previous process."""
+    count = images.resume_pending()
+    click.echo(f"Resubmitted {count} pending image job(s)")
+
+
+@app.cli.group("accounts")
+def accounts_cli():
+    """Manage account deletion jobs."""
+
+
+@accounts_cli.command("resume")
+def accounts_resume():
+    """Finish deletions left unfinished by a previous process, or that failed."""
+    count = deletion.resume()
+    click.echo(f"Ran {count} account deletion job(s)")
+
+
+@accounts_cli.command("cancel")
+@click.argument("username")
+def accounts_cancel(username):
+    """Stop deleting USERNAME's account and let them sign in again."""
+    count = deletion.cancel(username)
+    click.echo(f"Cancelled {count} account deletion job(s)")
+
+
+@app.cli.group("outbox")
+def outbox_cli():
+    """Deliver queued outgoing mail."""
+
+
+@outbox_cli.command("send")
+def outbox_send():
+    """Send every message that is currently due, then exit."""
+    sent = 0
+    while True:
+        batch = outbox.deliver_pending()
+        if not batch:
+            break
+        sent += batch
+    click.echo(f"Sent {sent} message(s)")
+
+
+@outbox_cli.command("work")
+def outbox_work():
+    """Keep delivering queued mail until interrupted."""
+    outbox.work(app._get_current_object())
+
+
+@app.cli.group("search")
+def search_cli():
+    """Maintain the full-text search index."""
+
+
+@search_cli.command("rebuild")
+def search_rebuild():
+    """Reindex every post and comment."""
+    search.rebuild()
+    click.echo("Search index rebuilt")
+
+
+@app.cli.group("posts")
+def posts_cli():
+    """Maintain stored post data."""
+
+
+@posts_cli.command("refresh-excerpts")
+@click.option("--batch-size", default=500, show_default=True)
+@click.option("--all", "refresh_all", is_flag=True, help="Also redo posts that have one.")
+def posts_refresh_excerpts(batch_size, refresh_all):
+    """Compute the excerpt and reading time of posts saved without one."""
+    query = Post.query.order_by(Post.id)
+    if not refresh_all:
+        query = query.filter(Post.excerpt.is_(None))
+    last_id, updated = 0, 0
+    while True:
+        batch = query.filter(Post.id > last_id).limit(batch_size).all()
+        if not batch:
+            break
+        for post in batch:
+            post.refresh_summary()
+        last_id = batch[-1].id
+        updated += len(batch)
+        db.session.commit()
+    click.echo(f"Refreshed {updated} post(s)")
+
+
+@app.cli.group("transfer")
+def transfer_cli():
+    """Move users, posts, comments and follows in and out as NDJSON."""
+
+
+@transfer_cli.command("export")
+@click.argument("output", type=click.File("w"), default="-")
+def transfer_export(output):
+    """Write every record to OUTPUT, standard output by default."""
+    for line in transfer.export_lines():
+        output.write(line)
+
+
+@transfer_cli.command("import")
+@click.argument("source", type=click.File("rb"))
+@click.option("--batch-size", type=int, help="Records per INSERT and commit.")
+def transfer_import(source, batch_size):
+    """Load the records in SOURCE ("-" for standard input)."""
+    importer = transfer.Importer(batch_size=batch_size)
+    try:
+        result = importer.feed(source).finish()
+    except transfer.InvalidRecord as e:
+        raise click.ClickException(str(e))
+    finally:
+        syndication.invalidate_all()
+    for kind in transfer.TYPES:
+        click.echo(
+            f"{kind}s: {result['imported'].get(kind, 0)} imported, "
+            f"{result['skipped'].get(kind, 0)} skipped"
+        )
+
+
+@app.cli.group("counters")
+def counters_cli():
+    """Maintain denormalized counts."""
+
+
+@counters_cli.command("repair")
+def counters_repair():
+    """Recompute every stored count from the tables it summarizes."""
+    users = User.recount()
+    posts = Post.recount()
+    db.session.commit()
+    click.echo(f"Recounted {users} user(s) and {posts} post(s)")
+
+
+@app.cli.group("queries")
+def queries_cli():
+    """Inspect the SQL the routes run."""
+
+
+@queries_cli.command("explain")
+@click.option("--verbose", "-v", is_flag=True, help="Print every plan.")
+def queries_explain(verbose):
+    """Fail if a route's main query reads a whole table (SQLite only)."""
+    if db.engine.dialect.name != "sqlite":
+        raise click.ClickException("EXPLAIN QUERY PLAN needs an SQLite database")
+    failed = 0
+    for plan in queryplans.check():
+        ok = not plan.full_scans
+        failed += not ok
+        click.echo(f"{'ok  ' if ok else 'FULL'} {plan.name}")
+        if verbose or not ok:
+            for line in plan.details:
+                click.echo(f"       {line}")
+    if failed:
+        raise click.ClickException(f"{failed} query plan(s) fall back to a full scan")
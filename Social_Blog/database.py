@@ -0,0 +1,123 @@
+import os
+import time
+import weakref
+from functools import wraps
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession
+from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = "replica"
+
+
+def _sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return on_connect
+
+
+# Engines whose pooled connections must not be shared with forked processes.
+# The parent closes its idle connections before forking (a pre-forking server
+# loading the app with ``--preload``, or a process pool starting its workers),
+# so there are none left for a child to inherit, and the child starts from a
+# new pool of its own. Held weakly, so an engine that is dropped goes away.
+_engines = weakref.WeakSet()
+
+
+def _dispose_engines():
+    for engine in list(_engines):
+        engine.dispose()
+
+
+os.register_at_fork(before=_dispose_engines, after_in_child=_dispose_engines)
+
+
+def use_replica(view):
+    """Let the reads of a GET view go to the ``replica`` bind when one is set.
+
+    Writes, and reads that follow a write in the same session, still go to
+    the primary. A reader who wrote something recently is kept on the primary
+    for ``REPLICA_STICKY_SECONDS`` so they see their own changes.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == "GET" and session.get("_primary_until", 0) < time.time():
+            g.use_replica = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        self._wrote = False
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        writing = self._flushing or isinstance(clause, UpdateBase)
+        if writing:
+            self._wrote = True
+            if has_request_context():
+                g.db_wrote = True
+        elif (
+            not self._wrote
+            and has_request_context()
+            and g.get("use_replica")
+            and REPLICA in (self.app.config["SQLALCHEMY_BINDS"] or {})
+        ):
+            return self.db.get_engine(self.app, bind=REPLICA)
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(_SQLAlchemy):
+    """Flask-SQLAlchemy with per-backend engine tuning and replica reads.
+
+    SQLite connections get ``SQLALCHEMY_SQLITE_PRAGMAS`` on connect, and
+    other databases get the pool settings in ``SQLALCHEMY_POOL_OPTIONS``, so
+    one profile works against either.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault("SQLALCHEMY_SQLITE_PRAGMAS", {})
+        app.config.setdefault("SQLALCHEMY_POOL_OPTIONS", {})
+        app.config.setdefault("REPLICA_STICKY_SECONDS", 5)
+        super().init_app(app)
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get("db_wrote"):
+                session["_primary_until"] = (
+                    time.time() + app.config["REPLICA_STICKY_SECONDS"]
+                )
+            return response
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        if sa_url.drivername.startswith("sqlite"):
+            pragmas = app.config["SQLALCHEMY_SQLITE_PRAGMAS"]
+            if pragmas:
+                options["_sqlite_pragmas"] = pragmas
+        else:
+            for name, value in app.config["SQLALCHEMY_POOL_OPTIONS"].items():
+                options.setdefault(name, value)
+        rv = super().apply_driver_hacks(app, sa_url, options)
+        # Flask-SQLAlchemy < 2.5 changes the options in place.
+        return rv if rv is not None else (sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop("_sqlite_pragmas", None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            event.listen(engine, "connect", _sqlite_pragmas(pragmas))
+        _engines.add(engine)
+        return engine
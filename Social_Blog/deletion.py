@@ -0,0 +1,359 @@
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app as app
+from sqlalchemy import or_
+
+from . import db, identity, pagecache, search, sidebar, syndication
+from .images import rendition_names
+from .models import (Comment, DeletionJob, Follow, ImageJob, Post,
+                     TimelineEntry, User)
+from .storage import get_storage
+
+# Deleting an account removes everything that points at it: follows both
+# ways, the comments on its posts, the posts, its comments elsewhere, its
+# timeline inbox and its images. That can be a lot of rows, so it happens in
+# a background job, one step after another, with set-based DELETEs of at most
+# ACCOUNT_DELETE_CHUNK rows that each commit together with the counters they
+# change. Every step just deletes whatever is left, so a job that was
+# interrupted is finished by running it again from the top.
+
+# Until its job is done or cancelled, the account cannot be signed in to; a
+# failed job holds it too, half deleted, until it is run again.
+FINISHED = ("done", "cancelled")
+DEFAULT_IMAGE = "default.jpg"
+
+_executor = None
+
+
+def _forget_executor():
+    # The pool's threads do not survive a fork; a child starts its own.
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config["ACCOUNT_DELETE_WORKERS"],
+            thread_name_prefix="deletion",
+        )
+    return _executor
+
+
+def _subtract(model, column, counts):
+    """Take ``counts[id]`` off ``column``, one UPDATE per distinct amount."""
+    by_amount = defaultdict(list)
+    for ident, amount in counts.items():
+        by_amount[amount].append(ident)
+    for amount, ids in by_amount.items():
+        model.query.filter(model.id.in_(ids)).update(
+            {column: column - amount}, synchronize_session=False
+        )
+
+
+def _following(user_id, limit, stale):
+    ids = [
+        followed_id
+        for followed_id, in db.session.query(Follow.followed_id)
+        .filter(Follow.follower_id == user_id)
+        .limit(limit)
+    ]
+    if ids:
+        _subtract(User, User.followers_count, dict.fromkeys(ids, 1))
+        Follow.query.filter(
+            Follow.follower_id == user_id, Follow.followed_id.in_(ids)
+        ).delete(synchronize_session=False)
+    return len(ids)
+
+
+def _followers(user_id, limit, stale):
+    ids = [
+        follower_id
+        for follower_id, in db.session.query(Follow.follower_id)
+        .filter(Follow.followed_id == user_id)
+        .limit(limit)
+    ]
+    if ids:
+        _subtract(User, User.following_count, dict.fromkeys(ids, 1))
+        Follow.query.filter(
+            Follow.followed_id == user_id, Follow.follower_id.in_(ids)
+        ).delete(synchronize_session=False)
+    return len(ids)
+
+
+def _delete_comments(rows):
+    """Delete ``(id, author_id)`` rows of comments on posts about to go."""
+    authors = Counter(author_id for _, author_id in rows if author_id is not None)
+    _subtract(User, User.comment_count, authors)
+    index = search.get_index()
+    for comment_id, _ in rows:
+        index.remove("comment", comment_id)
+    Comment.query.filter(Comment.id.in_([ident for ident, _ in rows])).delete(
+        synchronize_session=False
+    )
+
+
+def _comments_received(user_id, limit, stale):
+    posts = db.session.query(Post.id).filter(Post.user_id == user_id)
+    rows = (
+        db.session.query(Comment.id, Comment.author_id)
+        .filter(Comment.post_id.in_(posts.subquery()))
+        .limit(limit)
+        .all()
+    )
+    if rows:
+        _delete_comments(rows)
+    return len(rows)
+
+
+def _posts(user_id, limit, stale):
+    ids = [
+        post_id
+        for post_id, in db.session.query(Post.id)
+        .filter(Post.user_id == user_id)
+        .limit(limit)
+    ]
+    if not ids:
+        return 0
+    # Comments written since the previous step ran.
+    late = (
+        db.session.query(Comment.id, Comment.author_id)
+        .filter(Comment.post_id.in_(ids))
+        .all()
+    )
+    if late:
+        _delete_comments(late)
+    TimelineEntry.query.filter(TimelineEntry.post_id.in_(ids)).delete(
+        synchronize_session=False
+    )
+    Post.query.filter(Post.id.in_(ids)).delete(synchronize_session=False)
+    index = search.get_index()
+    for post_id in ids:
+        index.remove_post(post_id)
+        stale.update((f"post:{post_id}", f"comments:{post_id}"))
+    return len(ids) + len(late)
+
+
+def _comments_written(user_id, limit, stale):
+    rows = (
+        db.session.query(Comment.id, Comment.post_id)
+        .filter(Comment.author_id == user_id)
+        .limit(limit)
+        .all()
+    )
+    if not rows:
+        return 0
+    posts = Counter(post_id for _, post_id in rows if post_id is not None)
+    _subtract(Post, Post.comment_count, posts)
+    index = search.get_index()
+    for comment_id, _ in rows:
+        index.remove("comment", comment_id)
+    Comment.query.filter(Comment.id.in_([ident for ident, _ in rows])).delete(
+        synchronize_session=False
+    )
+    stale.update(f"comments:{post_id}" for post_id in posts)
+    return len(rows)
+
+
+def _inbox(user_id, limit, stale):
+    ids = [
+        post_id
+        for post_id, in db.session.query(TimelineEntry.post_id)
+        .filter(TimelineEntry.user_id == user_id)
+        .limit(limit)
+    ]
+    if ids:
+        TimelineEntry.query.filter(
+            TimelineEntry.user_id == user_id, TimelineEntry.post_id.in_(ids)
+        ).delete(synchronize_session=False)
+    return len(ids)
+
+
+def _delete_after_commit(names):
+    # Files go only once the rows pointing at them are gone for good, so a
+    # chunk that is rolled back never leaves rows without their images.
+    db.session.info.setdefault("deletion_files", []).extend(names)
+
+
+def _delete_files():
+    storage = get_storage()
+    for name in db.session.info.pop("deletion_files", ()):
+        storage.delete(name)
+
+
+def _images(user_id, limit, stale):
+    # Avatars and the images attached to posts alike. Jobs still being
+    # processed are only let go of; their files are kept, like those of any
+    # upload nobody points at.
+    ImageJob.query.filter_by(user_id=user_id, status="pending").update(
+        {ImageJob.user_id: None}, synchronize_session=False
+    )
+    jobs = ImageJob.query.filter_by(user_id=user_id).limit(limit).all()
+    if not jobs:
+        return 0
+    basenames = {job.basename for job in jobs}
+    # Uploads are stored by content, so someone else may have the same file.
+    shared = {
+        basename
+        for basename, in db.session.query(ImageJob.basename).filter(
+            ImageJob.basename.in_(basenames),
+            or_(ImageJob.user_id != user_id, ImageJob.user_id.is_(None)),
+        )
+    }
+    _delete_after_commit(
+        name
+        for job in jobs
+        if job.basename not in shared
+        for name in rendition_names(job.basename, job.ext)
+    )
+    ImageJob.query.filter(ImageJob.id.in_([job.id for job in jobs])).delete(
+        synchronize_session=False
+    )
+    return len(jobs)
+
+
+def _account(user_id, limit, stale):
+    # Requests that were already under way when the job started may have
+    # written after their step ran; sweep once more in this transaction.
+    swept = 0
+    for _, step in STEPS[:-1]:
+        while True:
+            count = step(user_id, limit, stale)
+            swept += count
+            if count < limit:
+                break
+    # An avatar uploaded before image jobs existed has no job to go with.
+    image_file = db.session.query(User.image_file).filter(User.id == user_id).scalar()
+    if image_file and image_file != DEFAULT_IMAGE:
+        others = User.query.filter(User.image_file == image_file, User.id != user_id)
+        jobs = ImageJob.query.filter_by(basename=image_file.split("-", 1)[0])
+        if not any(db.session.query(q.exists()).scalar() for q in (others, jobs)):
+            _delete_after_commit([image_file])
+    return swept + User.query.filter_by(id=user_id).delete(synchronize_session=False)
+
+
+STEPS = (
+    ("following", _following),
+    ("followers", _followers),
+    ("comments received", _comments_received),
+    ("posts", _posts),
+    ("comments written", _comments_written),
+    ("timeline", _inbox),
+    ("images", _images),
+    ("account", _account),
+)
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def run(job):
+    """Work through every step of ``job``, committing after each chunk."""
+    chunk = app.config["ACCOUNT_DELETE_CHUNK"]
+    job.status = "running"
+    job.error = None
+    db.session.commit()
+    try:
+        for name, step in STEPS:
+            job.step = name
+            while True:
+                stale = set()
+                count = step(job.user_id, chunk, stale)
+                job.deleted += count
+                db.session.commit()
+                _delete_files()
+                if stale:
+                    pagecache.bump(*stale)
+                # Reloaded after the commit: ``cancel`` may have run since.
+                if job.status == "cancelled":
+                    raise _Cancelled
+                if count < chunk:
+                    break
+    except _Cancelled:
+        pass
+    except Exception as e:
+        db.session.rollback()
+        db.session.info.pop("deletion_files", None)
+        app.logger.exception("Deleting account %s failed", job.username)
+        job.status = "failed"
+        job.error = repr(e)
+    else:
+        job.status = "done"
+        job.step = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    identity.invalidate(job.user_id)
+    sidebar.invalidate()
+    pagecache.bump("feed")
+    syndication.invalidate(job.user_id)
+    return job
+
+
+def _run(flask_app, job_id):
+    with flask_app.app_context():
+        try:
+            run(DeletionJob.query.get(job_id))
+        finally:
+            db.session.remove()
+
+
+def dispatch(job):
+    if not app.config["ACCOUNT_DELETE_WORKERS"]:
+        run(job)
+        return
+    _get_executor().submit(_run, app._get_current_object(), job.id)
+
+
+def unfinished(user_id):
+    return DeletionJob.query.filter(
+        DeletionJob.user_id == user_id, ~DeletionJob.status.in_(FINISHED)
+    ).first()
+
+
+def start(user):
+    """Queue ``user``'s account for deletion and return the job."""
+    job = unfinished(user.id)
+    if job is not None:
+        if job.status == "failed":
+            dispatch(job)
+        return job
+    job = DeletionJob(user_id=user.id, username=user.username)
+    db.session.add(job)
+    db.session.commit()
+    identity.invalidate(job.user_id)
+    dispatch(job)
+    return job
+
+
+def resume():
+    """Run jobs a previous process left unfinished, or that failed, to the end."""
+    jobs = DeletionJob.query.filter(~DeletionJob.status.in_(FINISHED)).all()
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def cancel(username):
+    """Stop deleting ``username``'s account and let them sign in to what is left.
+
+    Returns the number of jobs cancelled. A job that is running at the time
+    stops after the chunk it is on.
+    """
+    jobs = DeletionJob.query.filter(
+        DeletionJob.username == username, ~DeletionJob.status.in_(FINISHED)
+    ).all()
+    for job in jobs:
+        job.status = "cancelled"
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+    for job in jobs:
+        identity.invalidate(job.user_id)
+    return len(jobs)
@@ -0,0 +1,106 @@
+from collections import namedtuple
+
+from . import db, timeline
+from .models import Comment, Follow, Post, User
+from .pagination import encode_cursor, keyset_paginate
+
+FEED_KEYS = (Post.date_posted, Post.id)
+COMMENT_KEYS = (Comment.date_posted, Comment.id)
+
+CommentThread = namedtuple("CommentThread", "comments earlier latest more")
+
+
+def with_authors(query):
+    return query.options(db.joinedload(Post.author))
+
+
+def for_listing(query):
+    # List pages render the stored excerpt, never the article body.
+    return with_authors(query).options(db.defer(Post.content))
+
+
+def explore_query():
+    return for_listing(Post.query)
+
+
+def post_key(post):
+    return post.date_posted, post.id
+
+
+def followed_feed(user):
+    if timeline.enabled():
+        query, keys = timeline.feed_query(user)
+        return for_listing(query), keys
+    return followed_union(user)
+
+
+def followed_union(user):
+    # Same shape as User.followed_posts, with the body deferred on both sides
+    # of the UNION so it is not read by the inner selects either.
+    followed = Post.query.join(Follow, Follow.followed_id == Post.user_id).filter(
+        Follow.follower_id == user.id
+    )
+    own = Post.query.filter_by(user_id=user.id)
+    query = followed.options(db.defer(Post.content)).union(
+        own.options(db.defer(Post.content))
+    )
+    return for_listing(query), FEED_KEYS
+
+
+def profile_query(user):
+    return Post.query.filter_by(user_id=user.id).options(db.defer(Post.content))
+
+
+def comments_query(post):
+    return Comment.query.filter_by(post_id=post.id).options(
+        db.joinedload(Comment.author)
+    )
+
+
+def comment_key(comment):
+    return comment.date_posted, comment.id
+
+
+def comment_thread(post, per_page, since=None, before=None):
+    """Up to ``per_page`` comments on ``post``, oldest first.
+
+    With ``since``, the ones posted after that cursor, and ``more`` tells
+    whether others follow. Otherwise the latest ones, or those just before
+    ``before``, and ``earlier`` is the cursor for the page preceding them.
+    ``latest`` is the cursor to poll for newer comments with.
+    """
+    query = comments_query(post)
+    if since:
+        page = keyset_paginate(query, COMMENT_KEYS, since, per_page, descending=False)
+        comments, earlier, more = page.items, None, page.has_next
+    else:
+        page = keyset_paginate(query, COMMENT_KEYS, before, per_page)
+        comments, earlier, more = page.items[::-1], page.next_cursor, False
+    latest = encode_cursor(comment_key(comments[-1])) if comments else since
+    return CommentThread(comments, earlier, latest, more)
+
+
+def followers_query(user):
+    """Users following ``user`` with the time they followed, newest first."""
+    query = (
+        db.session.query(User, Follow.timestamp)
+        .join(Follow, Follow.follower_id == User.id)
+        .filter(Follow.followed_id == user.id)
+    )
+    return query, (Follow.timestamp, Follow.follower_id)
+
+
+def following_query(user):
+    """Users ``user`` follows with the time they were followed, newest first."""
+    query = (
+        db.session.query(User, Follow.timestamp)
+        .join(Follow, Follow.followed_id == User.id)
+        .filter(Follow.follower_id == user.id)
+    )
+    return query, (Follow.timestamp, Follow.followed_id)
+
+
+def follow_key(row):
+    user, timestamp = row
+    return timestamp, user.id
+
@@ -0,0 +1,104 @@
+from flask import current_app as app
+from flask_login import UserMixin
+
+from . import cache, pagecache, relationships
+from .models import User
+
+# The logged-in user is loaded on almost every request, mostly to show a name
+# and an avatar. A snapshot of those columns is cached together with the
+# user's version token ("user:<id>"), which the routes that change them bump.
+# The token and the snapshot are fetched in one lookup and the snapshot is
+# only used if its token is still current, so edits show up on the next
+# request and USER_CACHE_TIMEOUT only bounds how long a missed bump could go
+# unnoticed.
+
+FIELDS = ("id", "username", "email", "image_file", "bio", "post_count")
+
+
+class CachedIdentity(UserMixin):
+    """Stands in for ``current_user``, backed by a cached snapshot.
+
+    Reading anything outside the snapshot, and every assignment, loads the
+    real ``User`` row once and goes through it, as does ``record`` for code
+    that needs the mapped instance itself.
+    """
+
+    def __init__(self, fields, record=None):
+        object.__setattr__(self, "_fields", fields)
+        object.__setattr__(self, "_record", record)
+
+    @property
+    def record(self):
+        if self._record is None:
+            object.__setattr__(self, "_record", User.query.get(self._fields["id"]))
+        return self._record
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if self._record is None and name in self._fields:
+            return self._fields[name]
+        return getattr(self.record, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.record, name, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (CachedIdentity, User)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((User, self.id))
+
+    def __repr__(self):
+        return f"CachedIdentity({self.username!r})"
+
+    def is_following(self, user):
+        return relationships.is_following(self, user)
+
+    def is_followed_by(self, user):
+        return relationships.is_following(user, self)
+
+
+def snapshot(user):
+    return {name: getattr(user, name) for name in FIELDS}
+
+
+def _signed_in(user_id):
+    """The user, unless they are gone or their account is being deleted."""
+    from .deletion import unfinished
+
+    user = User.query.get(user_id)
+    if user is None or unfinished(user_id):
+        return None
+    return user
+
+
+def load(user_id):
+    user_id = int(user_id)
+    timeout = app.config["USER_CACHE_TIMEOUT"]
+    if not timeout:
+        user = _signed_in(user_id)
+        return CachedIdentity(snapshot(user), user) if user is not None else None
+    name = f"user:{user_id}"
+    key = f"identity:{user_id}"
+    token, entry = cache.get_many(pagecache.version_key(name), key)
+    if token is not None and entry is not None and entry[0] == token:
+        return CachedIdentity(entry[1])
+    # Starting a deletion bumps the version, so sessions the writer still has
+    # elsewhere end up here and are signed out.
+    if token is None:
+        token = pagecache.version(name)
+    user = _signed_in(user_id)
+    if user is None:
+        return None
+    fields = snapshot(user)
+    # Stored with the token read before the row, so a bump in between makes
+    # the next request miss rather than keep the old columns.
+    cache.set(key, (token, fields), timeout)
+    return CachedIdentity(fields, user)
+
+
+def invalidate(*user_ids):
+    pagecache.bump(*(f"user:{user_id}" for user_id in user_ids))
@@ -0,0 +1,224 @@
+import os
+import shutil
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from flask import current_app as app
+
+from . import db, identity
+from .instrumentation import timed
+from .models import ImageJob, User
+from .storage import get_storage, hash_to_file
+
+RENDITIONS = {"thumb": (125, 125), "medium": (1000, 1000)}
+FORMATS = {
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".png": "PNG",
+    ".gif": "GIF",
+    ".webp": "WEBP",
+}
+SAVE_OPTIONS = {"JPEG": {"quality": 85, "optimize": True}, "WEBP": {"quality": 80}}
+
+_executor = None
+
+
+def rendition_name(basename, rendition, ext):
+    return f"{basename}-{rendition}{ext}"
+
+
+def _save(image, path, format):
+    if format in ("JPEG", "WEBP") and image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if format == "WEBP" else "RGB")
+    if format == "JPEG" and image.mode == "RGBA":
+        image = image.convert("RGB")
+    # Renditions are written next to their final name and moved into place so
+    # a reader never sees a half-written file.
+    partial_path = path + ".part"
+    image.save(partial_path, format=format, **SAVE_OPTIONS.get(format, {}))
+    os.replace(partial_path, path)
+
+
+def process_image(source, dest_dir, basename, ext):
+    """Write every rendition of ``source`` plus a WebP copy of each.
+
+    Runs in a worker process. JPEGs are decoded through ``draft`` at the
+    largest size we need, and metadata is dropped on re-encode so EXIF never
+    reaches the public copies.
+    """
+    # Imported on first use: with IMAGE_WORKERS set, only the workers load it.
+    from PIL import Image, ImageOps
+
+    largest = max(RENDITIONS.values())
+    format = FORMATS[ext]
+    written = []
+    os.makedirs(dest_dir, exist_ok=True)
+    with Image.open(source) as original:
+        if original.format == "JPEG":
+            original.draft("RGB", largest)
+        image = ImageOps.exif_transpose(original)
+    image.info.pop("exif", None)
+    for rendition, size in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(size)
+        for name, fmt in (
+            (rendition_name(basename, rendition, ext), format),
+            (rendition_name(basename, rendition, ".webp"), "WEBP"),
+        ):
+            _save(resized, os.path.join(dest_dir, name), fmt)
+            written.append(name)
+    return written
+
+
+def rendition_names(basename, ext):
+    return [
+        rendition_name(basename, rendition, e)
+        for rendition in RENDITIONS
+        for e in (ext, ".webp")
+    ]
+
+
+def _forget_executor():
+    # A forked child cannot use its parent's workers; it starts its own.
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=app.config["IMAGE_WORKERS"])
+    return _executor
+
+
+def _source_path(job):
+    return os.path.join(app.config["IMAGE_PENDING_DEST"], f"{job.id}{job.ext}")
+
+
+def _staging_dir(job):
+    return os.path.join(app.config["IMAGE_PENDING_DEST"], f"job-{job.id}")
+
+
+def _complete(job, future):
+    staging = _staging_dir(job)
+    try:
+        written = future.result()
+        storage = get_storage()
+        for name in written:
+            storage.save(name, os.path.join(staging, name))
+    except Exception as e:
+        job.status = "failed"
+        job.error = repr(e)
+    else:
+        _done(job)
+    finally:
+        # Failed jobs are not retried, so neither the upload nor whatever
+        # renditions were written before the error are needed any more.
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            os.remove(_source_path(job))
+        except FileNotFoundError:
+            pass
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    if job.kind == "avatar" and job.user_id is not None:
+        identity.invalidate(job.user_id)
+
+
+def _done(job):
+    job.status = "done"
+    if job.kind == "avatar" and job.user_id is not None:
+        user = User.query.get(job.user_id)
+        if user is not None:
+            user.image_file = rendition_name(job.basename, "thumb", job.ext)
+
+
+def _finish(flask_app, job_id, future):
+    # Done-callbacks run on the executor's management thread, outside of any
+    # request, so they get their own app context and session.
+    with flask_app.app_context():
+        try:
+            _complete(ImageJob.query.get(job_id), future)
+        finally:
+            db.session.remove()
+
+
+def dispatch(job):
+    args = (_source_path(job), _staging_dir(job), job.basename, job.ext)
+    if not app.config["IMAGE_WORKERS"]:
+        future = Future()
+        try:
+            with timed("image"):
+                future.set_result(process_image(*args))
+        except Exception as e:
+            future.set_exception(e)
+        _complete(job, future)
+        return
+    future = _get_executor().submit(process_image, *args)
+    future.add_done_callback(partial(_finish, app._get_current_object(), job.id))
+
+
+def _readable(path):
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        return False
+    return True
+
+
+def submit(file, kind, user=None):
+    """Queue ``file`` for processing and return its job straight away.
+
+    Images are stored under the SHA-256 of the uploaded bytes, so an image
+    that is already in storage is reused instead of processed again. Raises
+    ``ValueError`` for file types not in ``FORMATS`` and for files Pillow
+    cannot read, so a URL is never handed out for a job bound to fail.
+    """
+    _, ext = os.path.splitext(file.filename)
+    ext = ext.lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported image type: {file.filename}")
+    with timed("upload"):
+        digest, upload = hash_to_file(file.stream, app.config["IMAGE_PENDING_DEST"])
+    if not _readable(upload):
+        os.remove(upload)
+        raise ValueError(f"Not a readable image: {file.filename}")
+    job = ImageJob(
+        basename=digest,
+        ext=ext,
+        kind=kind,
+        user_id=user.id if user is not None else None,
+    )
+    db.session.add(job)
+    storage = get_storage()
+    if all(storage.exists(name) for name in rendition_names(job.basename, job.ext)):
+        os.remove(upload)
+        _done(job)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return job
+    db.session.commit()
+    os.replace(upload, _source_path(job))
+    dispatch(job)
+    return job
+
+
+def resume_pending():
+    resumed = 0
+    for job in ImageJob.query.filter_by(status="pending").all():
+        if os.path.exists(_source_path(job)):
+            dispatch(job)
+            resumed += 1
+    return resumed
+
+
+def pending_job(filename):
+    basename = filename.split("-", 1)[0]
+    return ImageJob.query.filter_by(basename=basename, status="pending").first()
@@ -0,0 +1,261 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from flask import (Response, abort, before_render_template, current_app, g,
+                   has_request_context, request, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0])
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series[key]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(key, le=bound)} {cumulative}"
+            yield f"{self.name}_sum{_labels(key)} {total}"
+            yield f"{self.name}_count{_labels(key)} {cumulative}"
+
+
+class CounterMetric:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(key)} {value}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key, **extra):
+    pairs = [*key, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = defaultdict(float)
+        self.statements = Counter()
+        self._template_starts = []
+
+
+def _stats():
+    if has_request_context():
+        return g.get("_request_stats")
+    return None
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the ``name`` Server-Timing entry."""
+    stats = _stats()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[name] += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _stats() is not None:
+        conn.info.setdefault("_metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats()
+    if stats is not None and conn.info.get("_metrics_started"):
+        stats.timings["sql"] += time.perf_counter() - conn.info["_metrics_started"].pop()
+        stats.statements[statement] += 1
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats._template_starts.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats._template_starts:
+        started = stats._template_starts.pop()
+        # Only the outermost render counts, so nested renders aren't doubled.
+        if not stats._template_starts:
+            stats.timings["template"] += time.perf_counter() - started
+
+
+class Metrics:
+    """Opt-in request instrumentation.
+
+    With ``METRICS_ENABLED`` set, a ``METRICS_SAMPLE_RATE`` share of requests
+    is timed: SQL, template rendering and anything wrapped in ``timed()``.
+    Their figures go into per-endpoint histograms, served in the Prometheus
+    text format at ``/metrics``, and into a ``Server-Timing`` header. A
+    statement run ``METRICS_N_PLUS_ONE_THRESHOLD`` times or more in one
+    request is counted and logged as a likely N+1 query.
+
+    Figures are kept per process; scrape every worker, or run one.
+    """
+
+    def __init__(self, app=None):
+        self.request_duration = Histogram(
+            "devwrites_request_duration_seconds",
+            "Time spent handling sampled requests.",
+            LATENCY_BUCKETS,
+        )
+        self.sql_duration = Histogram(
+            "devwrites_request_sql_seconds",
+            "Time spent in SQL per sampled request.",
+            LATENCY_BUCKETS,
+        )
+        self.template_duration = Histogram(
+            "devwrites_request_template_seconds",
+            "Time spent rendering templates per sampled request.",
+            LATENCY_BUCKETS,
+        )
+        self.queries = Histogram(
+            "devwrites_request_queries",
+            "SQL statements executed per sampled request.",
+            QUERY_BUCKETS,
+        )
+        self.requests = CounterMetric(
+            "devwrites_requests_total", "Requests handled, sampled or not."
+        )
+        self.n_plus_one = CounterMetric(
+            "devwrites_n_plus_one_total",
+            "Sampled requests that repeated a statement past the threshold.",
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_ENABLED", False)
+        app.config.setdefault("METRICS_SAMPLE_RATE", 1.0)
+        app.config.setdefault("METRICS_SERVER_TIMING", True)
+        app.config.setdefault("METRICS_N_PLUS_ONE_THRESHOLD", 5)
+        app.config.setdefault("METRICS_TOKEN", None)
+        if not app.config["METRICS_ENABLED"]:
+            return
+        app.extensions["metrics"] = self
+
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_rendered, app)
+
+        @app.before_request
+        def start_sample():
+            if random.random() < app.config["METRICS_SAMPLE_RATE"]:
+                g._request_stats = RequestStats()
+
+        @app.after_request
+        def finish_sample(response):
+            endpoint = request.endpoint or "unmatched"
+            self.requests.inc(endpoint=endpoint, status=response.status_code)
+            stats = g.pop("_request_stats", None)
+            if stats is None or endpoint == "metrics":
+                return response
+            self._record(app, endpoint, stats, response)
+            return response
+
+        app.add_url_rule("/metrics", "metrics", self.expose)
+
+    def _record(self, app, endpoint, stats, response):
+        total = time.perf_counter() - stats.started
+        self.request_duration.observe(total, endpoint=endpoint)
+        self.sql_duration.observe(stats.timings["sql"], endpoint=endpoint)
+        self.template_duration.observe(stats.timings["template"], endpoint=endpoint)
+        self.queries.observe(sum(stats.statements.values()), endpoint=endpoint)
+
+        threshold = app.config["METRICS_N_PLUS_ONE_THRESHOLD"]
+        repeated = [(s, n) for s, n in stats.statements.items() if n >= threshold]
+        if repeated:
+            self.n_plus_one.inc(endpoint=endpoint)
+            for statement, count in repeated:
+                logger.warning(
+                    "Possible N+1 on %s: statement ran %d times: %s",
+                    endpoint,
+                    count,
+                    " ".join(statement.split()),
+                )
+
+        if app.config["METRICS_SERVER_TIMING"]:
+            entries = [
+                f'sql;dur={stats.timings["sql"] * 1000:.1f};'
+                f'desc="{sum(stats.statements.values())} queries"'
+            ]
+            entries.extend(
+                f"{name};dur={seconds * 1000:.1f}"
+                for name, seconds in stats.timings.items()
+                if name != "sql"
+            )
+            entries.append(f"total;dur={total * 1000:.1f}")
+            response.headers.add("Server-Timing", ", ".join(entries))
+
+    def expose(self):
+        token = current_app.config["METRICS_TOKEN"]
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(403)
+        lines = []
+        for metric in (
+            self.requests,
+            self.request_duration,
+            self.sql_duration,
+            self.template_duration,
+            self.queries,
+            self.n_plus_one,
+        ):
+            lines.extend(metric.render())
+        return Response(
+            "\n".join(lines) + "\n", content_type="text/plain; version=0.0.4"
+        )
@@ -6,15 +6,37 @@ from flask import current_app as app
 from . import db, login_manager
 from datetime import datetime
 from flask_login import UserMixin
+from .text import excerpt, reading_time, strip_html
+
+EXCERPT_LENGTH = 300
+
+
+def adjust_counts(model, ident, **deltas):
+    """Add ``deltas`` to the counter columns of one row with a single UPDATE.
+
+    The arithmetic happens in SQL, so concurrent writers never overwrite each
+    other's increments, and the change commits with the caller's transaction.
+    """
+    model.query.filter_by(id=ident).update(
+        {getattr(model, name): getattr(model, name) + delta for name, delta in deltas.items()})
+
+
+def _count(model, where):
+    return db.select([db.func.count()]).select_from(model.__table__).where(where).as_scalar()
 
 
 @login_manager.user_loader
 def load_user(user_id: int):
-    return User.query.get(user_id)
+    return identity.load(user_id)
 
 
 class Follow(db.Model):
     __tablename__ = 'follows'
+    __table_args__ = (
+        db.Index('ix_follows_followed_id_timestamp', 'followed_id', 'timestamp'),
+        db.Index('ix_follows_follower_id_timestamp', 'follower_id', 'timestamp'),
+        db.Index('ix_follows_followed_id_follower_id', 'followed_id', 'follower_id'),
+    )
     follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -24,9 +46,15 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(40), unique=True, nullable=False)
-    image_file = db.Column(db.String(20), nullable=False, default='default.jpg')
+    image_file = db.Column(db.String(80), nullable=False, default='default.jpg')
     bio = db.Column(db.String(120), nullable=False, default='Developer and Technical Writer')
     password = db.Column(db.String(60), nullable=False)
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Some of this writer's posts were left out of their followers' timelines.
+    fanout_skipped = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     posts = db.relationship('Post', backref='author', lazy=True)
     followed = db.relationship('Follow', foreign_keys=[Follow.follower_id],
                                backref=db.backref('follower', lazy='joined'),
@@ -37,22 +65,25 @@ class User(db.Model, UserMixin):
     comments = db.relationship('Comment', backref='author', lazy='dynamic')
 
     def follow(self, user):
-        if not self.is_following(user):
-            f = Follow(follower=self, followed=user)
-            db.session.add(f)
-            db.session.commit()
+        relationships.follow(self, [user])
 
     def unfollow(self, user):
-        f = self.followed.filter_by(followed_id=user.id).first()
-        if f:
-            db.session.delete(f)
-            db.session.commit()
+        relationships.unfollow(self, [user])
+
+    @staticmethod
+    def recount():
+        return User.query.update({
+            User.followers_count: _count(Follow, Follow.followed_id == User.id),
+            User.following_count: _count(Follow, Follow.follower_id == User.id),
+            User.post_count: _count(Post, Post.user_id == User.id),
+            User.comment_count: _count(Comment, Comment.author_id == User.id),
+        }, synchronize_session=False)
 
     def is_followed_by(self, user):
-        return self.followers.filter_by(follower_id=user.id).first() is not None
+        return relationships.is_following(user, self)
 
     def is_following(self, user):
-        return self.followed.filter_by(followed_id=user.id).first() is not None
+        return relationships.is_following(self, user)
 
     @property
     def followed_posts(self):
@@ -78,10 +109,17 @@ class User(db.Model, UserMixin):
 
 
 class Post(db.Model):
+    __table_args__ = (
+        db.Index('ix_post_date_posted_id', 'date_posted', 'id'),
+        db.Index('ix_post_user_id_date_posted', 'user_id', 'date_posted'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
+    excerpt = db.Column(db.Text)
+    reading_time = db.Column(db.Integer)
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     slug = db.Column(db.String, unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
@@ -91,12 +129,27 @@ class Post(db.Model):
                                    string.digits, k=6))
         self.slug = '-'.join([slugify(self.title), _])
 
+    def refresh_summary(self):
+        plain = strip_html(self.content)
+        self.excerpt = excerpt(plain, EXCERPT_LENGTH)
+        self.reading_time = reading_time(plain)
+
+    @staticmethod
+    def recount():
+        return Post.query.update(
+            {Post.comment_count: _count(Comment, Comment.post_id == Post.id)},
+            synchronize_session=False)
+
     def __repr__(self):
         return f"Post('{self.title}','{self.date_posted}')"
 
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_post_id_date_posted', 'post_id', 'date_posted'),
+        db.Index('ix_comments_author_id_date_posted', 'author_id', 'date_posted'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text)
     date_posted = db.Column(db.DateTime, index=True, default=datetime.utcnow)
@@ -106,3 +159,74 @@ class Comment(db.Model):
 
     def __repr__(self):
         return f"Comment('{self.author_id}','{self.date_posted}')"
+
+
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline'
+    __table_args__ = (
+        db.Index('ix_timeline_user_id_date_posted', 'user_id', 'date_posted', 'post_id'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    date_posted = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"TimelineEntry('{self.user_id}','{self.post_id}')"
+
+
+class ImageJob(db.Model):
+    __tablename__ = 'image_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    basename = db.Column(db.String(64), nullable=False, index=True)
+    ext = db.Column(db.String(10), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    status = db.Column(db.String(10), nullable=False, default='pending', index=True)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"ImageJob('{self.basename}','{self.status}')"
+
+
+class DeletionJob(db.Model):
+    __tablename__ = 'deletion_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key: the job outlives the user it deletes.
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    username = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending', index=True)
+    step = db.Column(db.String(20))
+    deleted = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"DeletionJob('{self.username}','{self.status}')"
+
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        db.Index('ix_outbox_sent_at_next_attempt_at', 'sent_at', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200), nullable=False)
+    sender = db.Column(db.String(120), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    claimed_at = db.Column(db.DateTime)
+    claimed_by = db.Column(db.String(32))
+
+    def __repr__(self):
+        return f"OutboxMessage('{self.subject}','{self.recipients}')"
+
+
+from . import identity, relationships, timeline  # noqa: E402
@@ -0,0 +1,153 @@
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app as app
+from flask_mail import Message
+from sqlalchemy import or_
+
+from . import db, mail
+from .models import OutboxMessage
+
+# Outgoing mail is written to the outbox table by the request and delivered
+# later in batches over a single SMTP session. Any number of consumers may run
+# (`flask outbox work`, or the thread in each web worker): a consumer first
+# claims a batch with one UPDATE that only matches unclaimed rows, and only
+# sends what it won. A claim is let go of once the batch is done, or taken
+# over after MAIL_OUTBOX_LEASE seconds if its consumer died on the way.
+
+MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+_wakeup = threading.Event()
+
+
+def enqueue(msg):
+    db.session.add(
+        OutboxMessage(
+            subject=msg.subject,
+            sender=msg.sender,
+            recipients=",".join(msg.recipients),
+            body=msg.body,
+        )
+    )
+    db.session.commit()
+    _wakeup.set()
+
+
+def _message(row):
+    return Message(
+        row.subject,
+        sender=row.sender,
+        recipients=row.recipients.split(","),
+        body=row.body,
+    )
+
+
+def _retry_later(row, error, now):
+    row.attempts += 1
+    row.last_error = repr(error)
+    delay = app.config["MAIL_OUTBOX_BACKOFF"] * 2 ** (row.attempts - 1)
+    row.next_attempt_at = now + timedelta(
+        seconds=min(delay, app.config["MAIL_OUTBOX_MAX_BACKOFF"])
+    )
+
+
+def _claim(batch_size, now):
+    """Claim up to ``batch_size`` due messages and return them."""
+    expired = now - timedelta(seconds=app.config["MAIL_OUTBOX_LEASE"])
+    unclaimed = or_(
+        OutboxMessage.claimed_at.is_(None), OutboxMessage.claimed_at < expired
+    )
+    ids = [
+        ident
+        for ident, in db.session.query(OutboxMessage.id)
+        .filter(
+            OutboxMessage.sent_at.is_(None),
+            OutboxMessage.next_attempt_at <= now,
+            OutboxMessage.attempts < app.config["MAIL_OUTBOX_MAX_ATTEMPTS"],
+            unclaimed,
+        )
+        .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+        .limit(batch_size)
+    ]
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Conditions repeated so that of two consumers that picked the same ids,
+    # only the first UPDATE matches.
+    OutboxMessage.query.filter(
+        OutboxMessage.id.in_(ids), OutboxMessage.sent_at.is_(None), unclaimed
+    ).update(
+        {OutboxMessage.claimed_at: now, OutboxMessage.claimed_by: token},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return (
+        OutboxMessage.query.filter_by(claimed_by=token)
+        .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+        .all()
+    )
+
+
+def deliver_pending(batch_size=None):
+    """Send up to ``batch_size`` due messages over one SMTP connection.
+
+    Returns the number of messages sent.
+    """
+    now = datetime.utcnow()
+    rows = _claim(batch_size or app.config["MAIL_OUTBOX_BATCH_SIZE"], now)
+    if not rows:
+        return 0
+    sent = 0
+    unsent = list(rows)
+    try:
+        with mail.connect() as connection:
+            for row in rows:
+                try:
+                    connection.send(_message(row))
+                except MESSAGE_ERRORS as e:
+                    _retry_later(row, e, now)
+                else:
+                    row.sent_at = datetime.utcnow()
+                    sent += 1
+                unsent.remove(row)
+    except (smtplib.SMTPException, OSError) as e:
+        # The connection itself failed; whatever was not attempted goes back
+        # into the queue with a backoff.
+        for row in unsent:
+            _retry_later(row, e, now)
+    for row in rows:
+        row.claimed_at = None
+        row.claimed_by = None
+    db.session.commit()
+    return sent
+
+
+def work(flask_app, stop=None):
+    stop = stop or threading.Event()
+    with flask_app.app_context():
+        interval = flask_app.config["MAIL_OUTBOX_POLL_INTERVAL"]
+        while not stop.is_set():
+            try:
+                while deliver_pending():
+                    pass
+            except Exception:
+                flask_app.logger.exception("Outbox delivery failed")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+            _wakeup.wait(interval)
+            _wakeup.clear()
+
+
+def start_worker(flask_app):
+    thread = threading.Thread(
+        target=work, args=(flask_app,), name="outbox", daemon=True
+    )
+    thread.start()
+    return thread
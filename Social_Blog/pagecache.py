@@ -0,0 +1,96 @@
+import time
+from functools import wraps
+
+from flask import current_app as app
+from flask import make_response, request, session
+from flask_login import current_user
+
+from . import cache
+
+# Cached pages and fragments are keyed on version tokens ("feed", "post:<id>",
+# "comments:<id>") that the write routes replace, so nothing has to be deleted
+# to invalidate them. A token that fell out of the cache is recreated with a
+# new value, which can only cause a miss, never a stale hit. That holds for
+# every worker because they share the cache: a process-local backend is
+# refused when WEB_CONCURRENCY is above 1.
+
+
+def version_key(name):
+    return f"version:{name}"
+
+
+def version(name):
+    key = version_key(name)
+    token = cache.get(key)
+    if token is None:
+        token = time.time_ns()
+        cache.set(key, token, timeout=0)
+    return token
+
+
+def bump(*names):
+    token = time.time_ns()
+    for name in names:
+        cache.set(version_key(name), token, timeout=0)
+
+
+def _key(prefix, name, versions):
+    tokens = ":".join(str(version(v)) for v in versions)
+    return f"{prefix}:{name}:{tokens}"
+
+
+def fragment(name, versions, render):
+    """Return the cached result of ``render()`` for ``name`` at ``versions``."""
+    return cache.get_or_set(
+        _key("fragment", name, versions),
+        render,
+        app.config["FRAGMENT_CACHE_TIMEOUT"],
+    )
+
+
+def cached_page(*versions):
+    """Serve whole responses from the cache for anonymous GET requests.
+
+    Logged-in readers and responses that carry flashed messages or set
+    cookies always go through the view, so per-user chrome is never shared.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (
+                request.method != "GET"
+                or current_user.is_authenticated
+                or session.get("_flashes")
+            ):
+                return view(*args, **kwargs)
+            key = _key("page", request.full_path, versions)
+            cached = cache.get(key)
+            if cached is not None:
+                body, status, headers = cached
+                response = make_response(body, status, headers)
+                response.headers["X-Cache"] = "HIT"
+                return response
+            response = make_response(view(*args, **kwargs))
+            if (
+                response.status_code == 200
+                and not response.direct_passthrough
+                and not response.is_streamed
+                and not session.modified
+                and "Set-Cookie" not in response.headers
+            ):
+                cache.set(
+                    key,
+                    (
+                        response.get_data(),
+                        response.status_code,
+                        [(k, v) for k, v in response.headers if k != "Content-Length"],
+                    ),
+                    app.config["PAGE_CACHE_TIMEOUT"],
+                )
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
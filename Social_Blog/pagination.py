@@ -0,0 +1,85 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, keys):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor(token)
+    try:
+        return [
+            datetime.fromisoformat(value) if isinstance(key.type, DateTime) else value
+            for key, value in zip(keys, values)
+        ]
+    except (TypeError, ValueError):
+        raise InvalidCursor(token)
+
+
+def _after(keys, values, descending):
+    # Expanded form of the row comparison (k0, k1, ...) < (v0, v1, ...) whose
+    # leading term is a plain range, so the index on the keys is used for it.
+    def beyond(key, value):
+        return key < value if descending else key > value
+
+    def at_or_beyond(key, value):
+        return key <= value if descending else key >= value
+
+    clause = beyond(keys[-1], values[-1])
+    for key, value in zip(reversed(keys[:-1]), reversed(values[:-1])):
+        clause = and_(at_or_beyond(key, value), or_(beyond(key, value), clause))
+    return clause
+
+
+def keyset_paginate(
+    query, keys, cursor=None, per_page=5, descending=True, key_func=None
+):
+    """Return the page of ``query`` that follows ``cursor`` when ordered by ``keys``.
+
+    ``keys`` must end with a unique column so every row has a distinct position.
+    ``key_func`` maps a result row back to its key values; by default the key
+    columns are read off the row by attribute name.
+    """
+    if cursor:
+        query = query.filter(_after(keys, decode_cursor(cursor, keys), descending))
+    order = [key.desc() if descending else key.asc() for key in keys]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        if key_func is None:
+            values = [getattr(last, key.key) for key in keys]
+        else:
+            values = key_func(last)
+        next_cursor = encode_cursor(values)
+    return KeysetPage(rows, next_cursor, per_page)
@@ -0,0 +1,110 @@
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import bcrypt as _bcrypt
+from flask import current_app as app
+from werkzeug.exceptions import ServiceUnavailable
+
+# bcrypt is deliberately slow, so it runs in a small process pool instead of
+# the request thread. At most PASSWORD_HASH_QUEUE hashes may be in flight;
+# beyond that requests get a 503 rather than piling up behind the pool.
+
+HASH = re.compile(r"\$2[abxy]?\$\d\d\$[./A-Za-z0-9]{53}")
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+class HashingBusy(ServiceUnavailable):
+    description = "Too many sign-ins at once, please try again in a moment."
+
+
+def _hash(password, rounds):
+    return _bcrypt.hashpw(password, _bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(password, hashed):
+    return _bcrypt.checkpw(password, hashed)
+
+
+def _forget_executor():
+    # A forked child cannot use its parent's workers, nor count on the state
+    # of locks another thread may have held; it starts its own.
+    global _executor, _slots, _lock
+    _executor = None
+    _slots = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config["PASSWORD_HASH_WORKERS"]
+            )
+            _slots = threading.BoundedSemaphore(app.config["PASSWORD_HASH_QUEUE"])
+    return _executor
+
+
+def _run(func, *args):
+    if not app.config["PASSWORD_HASH_WORKERS"]:
+        return func(*args)
+    executor = _get_executor()
+    slots = _slots
+    timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+    if not slots.acquire(timeout=timeout):
+        raise HashingBusy(retry_after=1)
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # A hash we stopped waiting for still occupies a worker, so its slot is
+    # only given back once it has actually finished.
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        raise HashingBusy(retry_after=1)
+
+
+def _encode(password):
+    return password.encode("utf-8")
+
+
+def is_hash(value):
+    """Whether ``value`` looks like a bcrypt hash ``verify`` can check."""
+    return isinstance(value, str) and HASH.fullmatch(value) is not None
+
+
+def rounds(hashed):
+    """The cost factor a ``$2b$12$...`` hash was made with."""
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def hash_password(password):
+    return _run(_hash, _encode(password), app.config["BCRYPT_LOG_ROUNDS"])
+
+
+def verify(user, password):
+    """Check ``password`` against ``user.password``.
+
+    When the hash was made with a different cost factor than the configured
+    ``BCRYPT_LOG_ROUNDS``, it is replaced on success; the caller commits.
+    """
+    if not _run(_check, _encode(password), user.password.encode("utf-8")):
+        return False
+    if rounds(user.password) != app.config["BCRYPT_LOG_ROUNDS"]:
+        user.password = hash_password(password)
+    return True
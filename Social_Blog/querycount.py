@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from . import db
+
+
+class QueryCounter:
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        if self.engine is None:
+            self.engine = db.engine
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(budget, engine=None):
+    """Fail if the enclosed block issues more than ``budget`` SQL statements.
+
+    Meant for tests, e.g. wrapping ``client.get("/explore")`` to pin a page to
+    a fixed number of queries regardless of how many posts it renders.
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > budget:
+        listing = "\n".join(
+            f"  {n}. {statement}" for n, statement in enumerate(counter.statements, 1)
+        )
+        raise QueryBudgetExceeded(
+            f"{counter.count} queries executed, budget was {budget}:\n{listing}"
+        )
@@ -0,0 +1,99 @@
+import re
+from collections import namedtuple
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy.orm import Query
+
+from . import db, relationships, syndication, timeline
+from .feeds import (COMMENT_KEYS, FEED_KEYS, comments_query, explore_query,
+                    followed_feed, followed_union, followers_query,
+                    following_query, profile_query)
+from .models import Post, User
+from .pagination import _after
+
+# Anything but a table read through an index or its primary key, for both the
+# "SCAN post" output of current SQLite and "SCAN TABLE post" of older ones.
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(?P<table>\w+?)(?:_\d+)?$")
+
+Plan = namedtuple("Plan", "name details full_scans")
+
+
+def route_queries():
+    """The main query behind each route, built the same way the route does."""
+    someone = SimpleNamespace(id=1)
+    cursor = [datetime.utcnow(), 1]
+    feed_order = [key.desc() for key in FEED_KEYS]
+    followed, keys = followed_feed(someone)
+    queries = [
+        ("explore", explore_query().order_by(*feed_order).limit(6)),
+        (
+            "explore (next page)",
+            explore_query()
+            .filter(_after(FEED_KEYS, cursor, True))
+            .order_by(*feed_order)
+            .limit(6),
+        ),
+        ("home (followed)", followed.order_by(*[k.desc() for k in keys]).limit(6)),
+        (
+            "profile",
+            profile_query(someone).order_by(Post.date_posted.desc()).limit(5),
+        ),
+        ("profile (user)", User.query.filter_by(username="someone")),
+        ("post", Post.query.filter_by(slug="some-post")),
+        (
+            "post (comments)",
+            comments_query(someone)
+            .order_by(*[key.desc() for key in COMMENT_KEYS])
+            .limit(21),
+        ),
+        (
+            "post (new comments)",
+            comments_query(someone)
+            .filter(_after(COMMENT_KEYS, cursor, False))
+            .order_by(*COMMENT_KEYS)
+            .limit(21),
+        ),
+        ("latest articles", Post.query.order_by(*feed_order).limit(5)),
+        ("follow buttons", relationships.edge_query(someone, [2, 3])),
+        ("writer feed", syndication.newest(Post.query.filter_by(user_id=1))),
+        ("site feed", syndication.newest(Post.query)),
+    ]
+    for name, build in (("followers", followers_query), ("following", following_query)):
+        query, keys = build(someone)
+        queries.append((name, query.order_by(*[k.desc() for k in keys]).limit(31)))
+    if timeline.enabled():
+        union, keys = followed_union(someone)
+        queries.append(
+            ("home (followed, no timeline)", union.order_by(*[k.desc() for k in keys]))
+        )
+    return queries
+
+
+def explain(statement):
+    if isinstance(statement, Query):
+        statement = statement.statement
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = [p.isoformat(" ") if isinstance(p, datetime) else p for p in params]
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {compiled}", params)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def check():
+    tables = {table.name for table in db.metadata.sorted_tables}
+    plans = []
+    for name, query in route_queries():
+        details = explain(query)
+        scans = []
+        for line in details:
+            match = FULL_SCAN.match(line)
+            if match and match.group("table") in tables:
+                scans.append(line)
+        plans.append(Plan(name, details, scans))
+    return plans
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from flask import current_app as app
+from flask import request
+from werkzeug.exceptions import TooManyRequests
+
+
+class TokenBuckets:
+    """In-memory token buckets, one per key.
+
+    A bucket holds up to ``capacity`` tokens and refills at ``capacity`` per
+    ``period`` seconds; every attempt takes one. Past ``max_keys`` buckets,
+    those untouched for an hour are dropped.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, period):
+        """Take a token for ``key``; return 0, or the seconds until one is free."""
+        now = time.monotonic()
+        rate = capacity / period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return 0
+
+    def _prune(self, now):
+        # Called with the lock held.
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if now - updated > 3600:
+                del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def _buckets():
+    buckets = app.extensions.get("rate_limits")
+    if buckets is None:
+        buckets = app.extensions["rate_limits"] = TokenBuckets()
+    return buckets
+
+
+def limit(scope, key, setting):
+    """Raise 429 once ``key`` used up the ``(attempts, seconds)`` in ``setting``."""
+    capacity, period = app.config[setting]
+    wait = _buckets().consume(f"{scope}:{key}", capacity, period)
+    if wait:
+        raise TooManyRequests(
+            "Too many attempts, please wait a moment and try again.",
+            retry_after=int(wait) + 1,
+        )
+
+
+def limit_password_attempt(account=None):
+    """Rate limit a request that is about to hash or check a password.
+
+    Every such request counts against the client's address; login attempts
+    also count against the account they name.
+    """
+    limit("ip", request.remote_addr, "PASSWORD_RATE_LIMIT_IP")
+    if account:
+        limit("account", account.strip().lower(), "PASSWORD_RATE_LIMIT_ACCOUNT")
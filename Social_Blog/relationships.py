@@ -0,0 +1,116 @@
+from flask import g
+from sqlalchemy import and_, or_
+
+from . import db, timeline
+from .models import Follow, User, adjust_counts
+
+# Follow edges seen during the current request, keyed (follower_id,
+# followed_id). Looking up a batch of users fills in both directions at once,
+# so a page asking "do I follow them" and "do they follow me" for every
+# author it shows costs a single query.
+
+
+def _edges():
+    if "follow_edges" not in g:
+        g.follow_edges = {}
+    return g.follow_edges
+
+
+def prefetch(user, ids):
+    """Load the follow edges between ``user`` and each of ``ids`` in one query."""
+    edges = _edges()
+    missing = {
+        i for i in ids if (user.id, i) not in edges or (i, user.id) not in edges
+    }
+    if not missing:
+        return
+    for i in missing:
+        edges[(user.id, i)] = edges[(i, user.id)] = False
+    for edge in edge_query(user, missing):
+        edges[tuple(edge)] = True
+
+
+def edge_query(user, ids):
+    """Follow edges running either way between ``user`` and ``ids``."""
+    return db.session.query(Follow.follower_id, Follow.followed_id).filter(
+        or_(
+            and_(Follow.follower_id == user.id, Follow.followed_id.in_(ids)),
+            and_(Follow.followed_id == user.id, Follow.follower_id.in_(ids)),
+        )
+    )
+
+
+def following_ids(user, ids):
+    """The subset of ``ids`` that ``user`` follows."""
+    prefetch(user, ids)
+    edges = _edges()
+    return {i for i in ids if edges[(user.id, i)]}
+
+
+def follower_ids(user, ids):
+    """The subset of ``ids`` that follow ``user``."""
+    prefetch(user, ids)
+    edges = _edges()
+    return {i for i in ids if edges[(i, user.id)]}
+
+
+def is_following(user, other):
+    return bool(following_ids(user, [other.id]))
+
+
+def _targets(user, users):
+    seen = {}
+    for other in users:
+        if other.id != user.id:
+            seen.setdefault(other.id, other)
+    return seen
+
+
+def follow(user, users):
+    """Make ``user`` follow each of ``users`` in one transaction.
+
+    Returns the users that were newly followed.
+    """
+    targets = _targets(user, users)
+    followed = following_ids(user, targets)
+    added = [other for i, other in targets.items() if i not in followed]
+    if not added:
+        return []
+    db.session.add_all(Follow(follower=user, followed=other) for other in added)
+    for other in added:
+        timeline.backfill(user, other)
+        _edges()[(user.id, other.id)] = True
+    _count(user, added, 1)
+    db.session.commit()
+    return added
+
+
+def unfollow(user, users):
+    """Make ``user`` stop following each of ``users`` in one transaction.
+
+    Returns the users that were followed before.
+    """
+    targets = _targets(user, users)
+    removed = [targets[i] for i in following_ids(user, targets)]
+    if not removed:
+        return []
+    Follow.query.filter(
+        Follow.follower_id == user.id,
+        Follow.followed_id.in_([other.id for other in removed]),
+    ).delete(synchronize_session=False)
+    for other in removed:
+        timeline.prune(user, other)
+        _edges()[(user.id, other.id)] = False
+    _count(user, removed, -1)
+    db.session.commit()
+    return removed
+
+
+def _count(user, others, delta):
+    adjust_counts(User, user.id, following_count=delta * len(others))
+    User.query.filter(User.id.in_([other.id for other in others])).update(
+        {User.followers_count: User.followers_count + delta},
+        synchronize_session=False,
+    )
+    for other in others:
+        db.session.expire(other, ["followers_count"])
@@ -1,55 +1,88 @@
-import os
-import secrets
+import hashlib
 
 from flask import abort
 from flask import current_app as app
 from flask import (flash, jsonify, make_response, redirect, render_template,
-                   request, send_from_directory, url_for)
+                   request, send_from_directory, session,
+                   stream_with_context, url_for)
 from flask_cors import cross_origin
 from flask_login import current_user, login_required, login_user, logout_user
 from flask_mail import Message
-from PIL import Image
-from sqlalchemy import func
-
-from . import bcrypt, db, mail
+from flask_sqlalchemy import Pagination
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+
+from . import (db, deletion, identity, images, outbox, pagecache, passwords,
+               ratelimit, relationships, search, sidebar, syndication, timeline,
+               transfer)
+from .database import use_replica
+from .feeds import (FEED_KEYS, comment_thread, explore_query, follow_key,
+                    followed_feed, followers_query, following_query, post_key,
+                    profile_query)
 from .forms import (CommentForm, LoginForm, PostForm, RegistrationForm,
                     RequestResetForm, ResetPasswordForm, UpdateProfileForm)
-from .models import Comment, Post, User
+from .models import Comment, DeletionJob, Post, User, adjust_counts
+from .pagination import InvalidCursor, keyset_paginate
+from .storage import get_storage
 
 
 @app.route("/")
+@pagecache.cached_page()
 def index():
     return render_template("index.html")
 
 
-@app.route("/home")
-@login_required
-def home():
-    show_followed = ""
-
+def home_feed(cursor=None):
     show_followed = request.cookies.get("show_followed")
     if show_followed == "1":
-        query_ = Post.query.filter_by(author=current_user)
-        query = current_user.followed_posts
+        query, keys = followed_feed(current_user)
         active = "followed"
     else:
-        query = Post.query
+        query, keys = explore_query(), FEED_KEYS
         active = "all"
-    page = request.args.get("page", 1, type=int)
-    posts_ = Post.query.order_by(Post.date_posted.desc()).all()
-    posts = query.order_by(Post.date_posted.desc()).paginate(page=page, per_page=5)
-    if len(posts_) >= 5:
-        top_articles = posts_[0:5]
-    else:
-        top_articles = posts_
-    users = (
-        User.query.outerjoin(Post).group_by(User.id).order_by(func.count().desc()).all()
-    )
-    if len(users) >= 5:
-        users = users[0:5]
+    try:
+        posts = keyset_paginate(
+            query,
+            keys,
+            cursor=cursor,
+            per_page=app.config["POSTS_PER_PAGE"],
+            key_func=post_key,
+        )
+    except InvalidCursor:
+        abort(400)
+    return posts, active
+
+
+@app.route("/home")
+@login_required
+@use_replica
+def home():
+    posts, active = home_feed(request.args.get("cursor"))
+    top_articles = sidebar.latest_articles()
+    users = sidebar.top_writers()
 
     return render_template(
-        "home.html", posts=posts, users=users, top_articles=top_articles, active=active
+        "home.html",
+        posts=posts,
+        users=users,
+        top_articles=top_articles,
+        active=active,
+    )
+
+
+@app.route("/home/more")
+@login_required
+@use_replica
+def home_more():
+    posts, _ = home_feed(request.args.get("cursor"))
+    return jsonify(
+        {
+            "html": render_template(
+                "_posts.html",
+                posts=posts.items,
+            ),
+            "next_cursor": posts.next_cursor,
+        }
     )
 
 
@@ -73,9 +106,8 @@ def show_followed():
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        ratelimit.limit_password_attempt()
+        hashed_password = passwords.hash_password(form.password.data)
         user = User(
             username=form.username.data, email=form.email.data, password=hashed_password
         )
@@ -96,8 +128,14 @@ def login():
         return redirect(url_for("home"))
     form = LoginForm()
     if form.validate_on_submit():
+        ratelimit.limit_password_attempt(form.email.data)
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and passwords.verify(user, form.password.data):
+            db.session.commit()
+            # Only told once the password has proved who is asking.
+            if deletion.unfinished(user.id):
+                flash("This account is being deleted", "danger-alert")
+                return render_template("login.html", form=form)
             login_user(user, remember=form.remember.data)
             next_page = request.args.get("next")
             flash("You've been logged in", "success-alert")
@@ -115,35 +153,24 @@ def logout():
     return redirect(url_for("login"))
 
 
-def save_picture(form_picture, output_size=(125, 125)):
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(app.config["UPLOADED_PHOTOS_DEST"], picture_fn)
-
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-
-    i.save(picture_path)
-
-    return picture_fn
-
-
 @app.route("/<string:user>", methods=["GET", "POST"])
 @login_required
 def profile(user):
     user = User.query.filter_by(username=user).first()
     if user is None:
         abort(404)
-    article = len(user.posts)
-    contributions = len(user.posts) + user.comments.count()
+    article = user.post_count
+    contributions = user.post_count + user.comment_count
     image_file = url_for("static", filename="images/" + user.image_file)
     page = request.args.get("page", 1, type=int)
-    posts = (
-        Post.query.filter_by(author=user)
-        .order_by(Post.date_posted.desc())
-        .paginate(page=page, per_page=5)
-    )
+    if page < 1:
+        abort(404)
+    # The stored post count stands in for paginate()'s COUNT(*) query.
+    query = profile_query(user).order_by(Post.date_posted.desc())
+    items = query.limit(5).offset((page - 1) * 5).all()
+    if not items and page != 1:
+        abort(404)
+    posts = Pagination(query, page, 5, user.post_count, items)
 
     return render_template(
         "profile.html",
@@ -155,6 +182,34 @@ def profile(user):
     )
 
 
+@app.route("/feed.<any(xml, atom, json):format>")
+@use_replica
+def site_feed(format):
+    return syndication.response(
+        format,
+        Post.query,
+        "DevWrites",
+        "The latest articles on DevWrites",
+        url_for("explore", _external=True),
+    )
+
+
+@app.route("/<string:user>/feed.<any(xml, atom, json):format>")
+@use_replica
+def writer_feed(user, format):
+    user = User.query.filter_by(username=user).first()
+    if user is None:
+        abort(404)
+    return syndication.response(
+        format,
+        Post.query.filter_by(user_id=user.id),
+        f"{user.username} on DevWrites",
+        user.bio or f"Articles by {user.username}",
+        url_for("profile", user=user.username, _external=True),
+        author_id=user.id,
+    )
+
+
 @app.route("/<string:user>/update", methods=["GET", "POST"])
 @login_required
 def update(user):
@@ -162,12 +217,19 @@ def update(user):
         form = UpdateProfileForm()
         if form.validate_on_submit():
             if form.picture.data:
-                picture_file = save_picture(form.picture.data)
-                current_user.image_file = picture_file
+                try:
+                    images.submit(form.picture.data, "avatar", current_user)
+                except ValueError:
+                    form.picture.errors.append("This file could not be read as an image.")
+                    return render_template("update.html", form=form)
             current_user.username = form.username.data
             current_user.email = form.email.data
             current_user.bio = form.bio.data
             db.session.commit()
+            identity.invalidate(current_user.id)
+            sidebar.invalidate()
+            pagecache.bump("feed")
+            syndication.invalidate(current_user.id)
             flash("Profile successfully updated", "success-alert")
             return redirect(url_for("profile", user=current_user.username))
         elif request.method == "GET":
@@ -179,47 +241,147 @@ def update(user):
         abort(403)
 
 
+@app.route("/account/export")
+@login_required
+def export_account():
+    """Stream the current writer's profile, posts and their comments as NDJSON."""
+    lines = transfer.export_lines(current_user.record)
+    response = app.response_class(
+        stream_with_context(lines), mimetype="application/x-ndjson"
+    )
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename={current_user.username}.ndjson"
+    )
+    return response
+
+
+@app.route("/account/import", methods=["POST"])
+@login_required
+def import_account():
+    """Add the posts in an NDJSON body to the current writer's articles."""
+    limit = app.config["TRANSFER_UPLOAD_LIMIT"]
+    if (request.content_length or 0) > limit:
+        abort(413)
+    importer = transfer.Importer(author=current_user.record)
+    error = None
+    try:
+        importer.feed(transfer.limited_lines(request.stream, limit)).finish()
+    except transfer.InvalidRecord as e:
+        # Batches written before the bad line stay imported.
+        error = str(e)
+        status = 413 if isinstance(e, transfer.TooLarge) else 400
+    identity.invalidate(current_user.id)
+    sidebar.invalidate()
+    pagecache.bump("feed")
+    syndication.invalidate(current_user.id)
+    if error:
+        return jsonify(error=error, **importer.summary()), status
+    return jsonify(importer.summary())
+
+
 @app.route("/<string:user>/delete", methods=["GET", "POST"])
 @login_required
 def delete_account(user):
     if user == current_user.username:
-        user = User.query.filter_by(username=user).first()
-        db.session.delete(user)
-        db.session.commit()
-        flash("Your account has been deleted", "success-alert")
+        job = deletion.start(current_user.record)
+        logout_user()
+        session["deletion_job"] = job.id
+        flash("Your account is being deleted", "success-alert")
         return redirect(url_for("register"))
     else:
         abort(403)
 
 
+@app.route("/account/deletion")
+def deletion_status():
+    job = DeletionJob.query.get(session.get("deletion_job", 0))
+    if job is None:
+        abort(404)
+    return jsonify(status=job.status, step=job.step, deleted=job.deleted)
+
+
+def explore_feed(cursor=None):
+    try:
+        return keyset_paginate(
+            explore_query(),
+            FEED_KEYS,
+            cursor=cursor,
+            per_page=app.config["POSTS_PER_PAGE"],
+        )
+    except InvalidCursor:
+        abort(400)
+
+
 @app.route("/explore")
+@pagecache.cached_page("feed")
+@use_replica
 def explore():
-    posts = Post.query.order_by(Post.date_posted.desc()).all()
-    if len(posts) >= 5:
-        top_articles = posts[0:5]
-    else:
-        top_articles = posts
-    users = (
-        User.query.outerjoin(Post).group_by(User.id).order_by(func.count().desc()).all()
-    )
-    if len(users) >= 5:
-        users = users[0:5]
+    posts = explore_feed(request.args.get("cursor"))
+    top_articles = sidebar.latest_articles()
+    users = sidebar.top_writers()
     return render_template(
-        "explore.html", posts=posts, users=users, top_articles=top_articles
+        "explore.html",
+        posts=posts,
+        users=users,
+        top_articles=top_articles,
     )
 
 
+@app.route("/explore/more")
+@pagecache.cached_page("feed")
+@use_replica
+def explore_more():
+    posts = explore_feed(request.args.get("cursor"))
+    return jsonify(
+        {
+            "html": render_template(
+                "_posts.html",
+                posts=posts.items,
+            ),
+            "next_cursor": posts.next_cursor,
+        }
+    )
+
+
+@app.route("/search")
+def search_posts():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    results = search.search(query, page=page, per_page=app.config["SEARCH_PER_PAGE"])
+    post_ids = {hit.post_id for hit in results.hits}
+    posts = {}
+    if post_ids:
+        posts = {
+            post.id: post
+            for post in Post.query.options(
+                db.joinedload(Post.author), db.defer(Post.content)
+            ).filter(Post.id.in_(post_ids))
+        }
+    return render_template("search.html", query=query, results=results, posts=posts)
+
+
 @app.route("/new", methods=["GET", "POST"])
 @login_required
 def new_post():
     form = PostForm()
     if form.validate_on_submit():
         post = Post(
-            title=form.title.data, content=form.content.data, author=current_user
+            title=form.title.data,
+            content=form.content.data,
+            author=current_user.record,
         )
         db.session.add(post)
         post.create_slug()
+        post.refresh_summary()
+        db.session.flush()
+        adjust_counts(User, current_user.id, post_count=1)
+        timeline.fan_out(post)
+        search.index_post(post)
         db.session.commit()
+        identity.invalidate(current_user.id)
+        sidebar.invalidate()
+        pagecache.bump("feed")
+        syndication.invalidate(current_user.id)
         flash("You've successfully published your article", "success-alert")
         return redirect(url_for("home"))
     return render_template(
@@ -231,36 +393,140 @@ def new_post():
 @cross_origin()
 def upload_attachment():
     file = request.files["file"]
-    _ = save_picture(file, output_size=(1000, 1000))
+    # Recorded so the writer's images go when their account does.
+    uploader = current_user.record if current_user.is_authenticated else None
+    try:
+        job = images.submit(file, "attachment", uploader)
+    except ValueError:
+        abort(400)
+    _ = images.rendition_name(job.basename, "medium", job.ext)
     file_url = url_for("serve_photo", filename=_, _external=True)
     return jsonify({"url": file_url})
 
 
 @app.route("/photos/<filename>")
 def serve_photo(filename):
-    return send_from_directory(app.config["UPLOADED_PHOTOS_DEST"], filename)
+    storage = get_storage()
+    try:
+        exists = storage.exists(filename)
+    except ValueError:
+        abort(404)
+    if not exists and images.pending_job(filename) is not None:
+        # The URL is handed out before the renditions exist, and a browser
+        # never fetches a broken <img> again. The original still carries its
+        # EXIF data, so a placeholder stands in, kept out of every cache.
+        response = send_from_directory(app.static_folder, "img/processing.svg")
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    if not exists:
+        abort(404)
+    return storage.send(filename)
 
 
 @app.route("/<post_author>/<post_slug>", methods=["GET", "POST"])
 @login_required
 def post(post_author, post_slug):
-    post = Post.query.filter_by(slug=post_slug).first()
+    post = (
+        Post.query.options(db.joinedload(Post.author), db.defer(Post.content))
+        .filter_by(slug=post_slug)
+        .first()
+    )
+    if post is None:
+        abort(404)
     form = CommentForm()
     if form.validate_on_submit():
         comment = Comment(
-            body=form.body.data, post=post, author=current_user._get_current_object()
+            body=form.body.data, post=post, author=current_user.record
         )
         db.session.add(comment)
+        db.session.flush()
+        adjust_counts(Post, post.id, comment_count=1)
+        adjust_counts(User, current_user.id, comment_count=1)
+        search.index_comment(comment)
         db.session.commit()
+        pagecache.bump("feed", f"comments:{post.id}")
         return redirect(
             url_for("post", post_author=post.author.username, post_slug=post.slug)
         )
-    comments = post.comments.order_by(Comment.date_posted.asc()).all()
+
+    def render_comments():
+        thread = comment_thread(post, app.config["COMMENTS_PER_PAGE"])
+        html = render_template("_comments.html", post=post, comments=thread.comments)
+        return Markup(html), thread.earlier, thread.latest
+
+    post_body = pagecache.fragment(
+        f"post_body:{post.id}", [f"post:{post.id}"], lambda: Markup(post.content)
+    )
+    comments_html, earlier, latest = pagecache.fragment(
+        f"comments:{post.id}", [f"comments:{post.id}"], render_comments
+    )
     return render_template(
-        "post.html", title=post.title, post=post, comments=comments, form=form
+        "post.html",
+        title=post.title,
+        post=post,
+        post_body=post_body,
+        comments_html=comments_html,
+        earlier_comments=earlier,
+        latest_comment=latest,
+        comment_count=post.comment_count,
+        form=form,
     )
 
 
+@app.route("/post/<int:post_id>/comments")
+@login_required
+@use_replica
+def post_comments(post_id):
+    """A page of a post's comments as JSON, for paging back and polling.
+
+    ``?since=<cursor>`` returns the comments after that one, ``?before=``
+    the page preceding it, and neither the latest page. Responses carry an
+    ETag on the thread's state, so a poll that finds nothing new is a 304.
+    """
+    post = Post.query.options(db.defer(Post.content)).get_or_404(post_id)
+    since, before = request.args.get("since"), request.args.get("before")
+    newest = (
+        db.session.query(Comment.date_posted, Comment.id)
+        .filter(Comment.post_id == post.id)
+        .order_by(Comment.date_posted.desc(), Comment.id.desc())
+        .first()
+    )
+    state = f"{since}:{before}:{post.comment_count}:{newest}"
+    etag = hashlib.sha1(state.encode("utf-8")).hexdigest()
+    if not is_resource_modified(request.environ, etag):
+        response = make_response("", 304)
+    else:
+        try:
+            thread = comment_thread(
+                post, app.config["COMMENTS_PER_PAGE"], since=since, before=before
+            )
+        except InvalidCursor:
+            abort(400)
+        response = jsonify(
+            {
+                "html": render_template(
+                    "_comments.html", post=post, comments=thread.comments
+                ),
+                "comments": [
+                    {
+                        "id": comment.id,
+                        "author": comment.author.username,
+                        "body": comment.body,
+                        "date_posted": comment.date_posted.isoformat(),
+                    }
+                    for comment in thread.comments
+                ],
+                "earlier": thread.earlier,
+                "latest": thread.latest,
+                "more": thread.more,
+            }
+        )
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route("/<post_id>/comment/<id>/delete", methods=["GET", "POST"])
 @login_required
 def delete_comment(id, post_id):
@@ -268,8 +534,12 @@ def delete_comment(id, post_id):
     comment = Comment.query.get_or_404(id)
     if current_user.username == comment.author.username:
 
+        search.remove_comment(comment)
+        adjust_counts(Post, comment.post_id, comment_count=-1)
+        adjust_counts(User, comment.author_id, comment_count=-1)
         db.session.delete(comment)
         db.session.commit()
+        pagecache.bump("feed", f"comments:{post.id}")
 
         return redirect(
             url_for("post", post_author=post.author.username, post_slug=post.slug)
@@ -288,7 +558,12 @@ def update_post(post_author, post_slug):
     if form.validate_on_submit():
         post.title = form.title.data
         post.content = form.content.data
+        post.refresh_summary()
+        search.index_post(post)
         db.session.commit()
+        sidebar.invalidate()
+        pagecache.bump("feed", f"post:{post.id}")
+        syndication.invalidate(post.user_id)
         flash("Your article has been updated!", "success-alert")
         return redirect(
             url_for("post", post_author=post.author.username, post_slug=post.slug)
@@ -307,8 +582,15 @@ def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
     if post.author != current_user:
         abort(403)
+    timeline.remove_post(post)
+    search.remove_post(post)
+    adjust_counts(User, post.user_id, post_count=-1)
     db.session.delete(post)
     db.session.commit()
+    identity.invalidate(post.user_id)
+    sidebar.invalidate()
+    pagecache.bump("feed", f"post:{post.id}", f"comments:{post.id}")
+    syndication.invalidate(post.user_id)
     flash("Your article has been deleted!", "success-alert")
     return redirect(url_for("home"))
 
@@ -319,10 +601,10 @@ def follow(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         flash("Invalid User", "danger-alert")
-    if current_user.is_following(user):
+        return redirect(url_for("home"))
+    if not relationships.follow(current_user.record, [user]):
         flash("You are already following this user", "danger-alert")
         return redirect(url_for("profile", user=username))
-    current_user.follow(user)
     flash("You are now following this user", "success-alert")
     return redirect(url_for("profile", user=username))
 
@@ -333,42 +615,80 @@ def unfollow(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         flash("Invalid User", "danger-alert")
-    if not current_user.is_following(user):
+        return redirect(url_for("home"))
+    if not relationships.unfollow(current_user.record, [user]):
         flash("You were not following this user", "danger-alert")
         return redirect(url_for("profile", user=username))
-    current_user.unfollow(user)
 
     flash("You have unfollowed this user", "success-alert")
     return redirect(url_for("profile", user=username))
 
 
-@app.route("/<user>/followers")
+@app.route("/follows", methods=["POST", "DELETE"])
 @login_required
-def followers(user):
-    user = User.query.filter_by(username=user).first()
-    users = []
+def bulk_follow():
+    """Follow (POST) or unfollow (DELETE) ``{"usernames": [...]}`` at once."""
+    usernames = (request.get_json(silent=True) or {}).get("usernames")
+    if not isinstance(usernames, list) or not all(
+        isinstance(name, str) for name in usernames
+    ):
+        abort(400)
+    if len(usernames) > app.config["FOLLOWS_BULK_LIMIT"]:
+        abort(413)
+    users = User.query.filter(User.username.in_(usernames)).all() if usernames else []
+    me = current_user.record
+    if request.method == "POST":
+        changed = relationships.follow(me, users)
+    else:
+        changed = relationships.unfollow(me, users)
+    following = relationships.following_ids(me, [user.id for user in users])
+    return jsonify(
+        {
+            "changed": sorted(user.username for user in changed),
+            "following": sorted(u.username for u in users if u.id in following),
+            "unknown": sorted(set(usernames) - {user.username for user in users}),
+        }
+    )
+
 
-    for i in user.followers:
-        id = i.follower_id
-        user_person = User.query.filter_by(id=id).first()
-        users.append(user_person)
-    if user.followers.count() == 0:
+def follow_list(user, count, build_query, title):
+    if count == 0:
         return redirect(url_for("profile", user=user.username))
-    return render_template("followers.html", users=users)
+    query, keys = build_query(user)
+    try:
+        page = keyset_paginate(
+            query,
+            keys,
+            cursor=request.args.get("cursor"),
+            per_page=app.config["FOLLOWS_PER_PAGE"],
+            key_func=follow_key,
+        )
+    except InvalidCursor:
+        abort(400)
+    users = [row[0] for row in page.items]
+    relationships.prefetch(current_user, [u.id for u in users])
+    return render_template(
+        "followers.html",
+        users=users,
+        page=page,
+        user=user,
+        count=count,
+        title=title,
+    )
+
+
+@app.route("/<user>/followers")
+@login_required
+def followers(user):
+    user = User.query.filter_by(username=user).first_or_404()
+    return follow_list(user, user.followers_count, followers_query, "Followers")
 
 
 @app.route("/<user>/following")
 @login_required
 def followed(user):
-    user = User.query.filter_by(username=user).first()
-    users = []
-    for i in user.followed:
-        id = i.followed_id
-        user_person = User.query.filter_by(id=id).first()
-        users.append(user_person)
-    if user.followed.count() == 0:
-        return redirect(url_for("profile", user=user.username))
-    return render_template("followers.html", users=users)
+    user = User.query.filter_by(username=user).first_or_404()
+    return follow_list(user, user.following_count, following_query, "Following")
 
 
 @app.route("/theproject")
@@ -389,7 +709,7 @@ def send_reset_email(user):
 
     If you didn't make this request, please ignore this email
     """
-    mail.send(msg)
+    outbox.enqueue(msg)
 
 
 @app.route("/reset_password", methods=["GET", "POST"])
@@ -415,11 +735,10 @@ def reset_token(token):
         return redirect(url_for("reset_request"))
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
-        user.password = hashed_password
+        ratelimit.limit_password_attempt()
+        user.password = passwords.hash_password(form.password.data)
         db.session.commit()
+        identity.invalidate(user.id)
         flash("Your password has been updated! You are now able to log in", "success")
         return redirect(url_for("login"))
     return render_template("reset_token.html", title="Reset Password", form=form)
@@ -0,0 +1,397 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from flask import current_app as app
+from markupsafe import Markup, escape
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import Comment, Post
+from .text import strip_html
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+OPEN, CLOSE = "\x02", "\x03"
+SNIPPET_WORDS = 24
+
+SearchHit = namedtuple("SearchHit", "kind ref_id post_id title snippet")
+
+# Session.info key of the InvertedIndex changes waiting for a commit.
+PENDING = "search_pending"
+
+
+class SearchResults:
+    def __init__(self, hits, total, page, per_page):
+        self.hits = hits
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+
+def tokenize(value):
+    return TOKEN.findall(value.lower())
+
+
+def _highlight(value):
+    # Highlight markers are control characters so the text can be escaped
+    # before they are turned into tags.
+    return Markup(
+        str(escape(value)).replace(OPEN, "<mark>").replace(CLOSE, "</mark>")
+    )
+
+
+def _documents_for_post(post):
+    return [("post", post.id, post.id, post.title, strip_html(post.content))]
+
+
+def _document_for_comment(comment):
+    return ("comment", comment.id, comment.post_id, "", comment.body or "")
+
+
+def _rowid(kind, ref_id):
+    # Posts and comments share the table, so their ids are interleaved; a
+    # document is then found, replaced or removed through the rowid alone.
+    return ref_id * 2 + (kind == "comment")
+
+
+class Fts5Index:
+    """Search backed by an SQLite FTS5 table living next to the app tables."""
+
+    def __init__(self):
+        # Created on its own connection so that the first write to the index
+        # does not commit the request's transaction early.
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                    "title, body, kind UNINDEXED, ref_id UNINDEXED, "
+                    "post_id UNINDEXED, tokenize='porter unicode61')"
+                )
+            )
+
+    def add(self, documents, replace=True):
+        rows = [
+            dict(
+                rowid=_rowid(kind, ref_id),
+                title=title,
+                body=body,
+                kind=kind,
+                ref_id=ref_id,
+                post_id=post_id,
+            )
+            for kind, ref_id, post_id, title, body in documents
+        ]
+        if not rows:
+            return
+        if replace:
+            db.session.execute(
+                text("DELETE FROM search_index WHERE rowid = :rowid"), rows
+            )
+        db.session.execute(
+            text(
+                "INSERT INTO search_index (rowid, title, body, kind, ref_id, post_id) "
+                "VALUES (:rowid, :title, :body, :kind, :ref_id, :post_id)"
+            ),
+            rows,
+        )
+
+    def remove(self, kind, ref_id):
+        db.session.execute(
+            text("DELETE FROM search_index WHERE rowid = :rowid"),
+            dict(rowid=_rowid(kind, ref_id)),
+        )
+
+    def remove_post(self, post_id):
+        # The post's comments are found through the comments table, whose
+        # post_id is indexed; the copy in search_index is not.
+        db.session.execute(
+            text(
+                "DELETE FROM search_index WHERE rowid = :rowid OR rowid IN "
+                "(SELECT id * 2 + 1 FROM comments WHERE post_id = :post_id)"
+            ),
+            dict(rowid=_rowid("post", post_id), post_id=post_id),
+        )
+
+    def clear(self):
+        db.session.execute(text("DELETE FROM search_index"))
+
+    def search(self, terms, page, per_page):
+        # Every term must match; the last one is also matched as a prefix so
+        # results show up while the reader is still typing.
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        params = dict(match=match, open=OPEN, close=CLOSE)
+        total = db.session.execute(
+            text("SELECT count(*) FROM search_index WHERE search_index MATCH :match"),
+            params,
+        ).scalar()
+        rows = db.session.execute(
+            text(
+                "SELECT kind, ref_id, post_id, "
+                "highlight(search_index, 0, :open, :close), "
+                f"snippet(search_index, 1, :open, :close, '…', {SNIPPET_WORDS}) "
+                "FROM search_index WHERE search_index MATCH :match "
+                "ORDER BY bm25(search_index, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+            ),
+            dict(params, limit=per_page, offset=(page - 1) * per_page),
+        )
+        hits = [
+            SearchHit(kind, ref_id, post_id, _highlight(title), _highlight(snippet))
+            for kind, ref_id, post_id, title, snippet in rows
+        ]
+        return hits, total
+
+
+def _rules(terms):
+    """``(term, prefix)`` pairs: every term must match, the last as a prefix."""
+    return [(term, n == len(terms) - 1) for n, term in enumerate(terms)]
+
+
+def _matches(token, term, prefix):
+    return token == term or (prefix and token.startswith(term))
+
+
+class InvertedIndex:
+    """Pure-Python fallback for databases without FTS5.
+
+    Postings live in memory and are loaded from the database on first use,
+    then kept current by the same hooks that feed the FTS5 table. Those
+    changes are held back until the session commits and dropped if it rolls
+    back, so the postings never show rows the database does not have. Being
+    private to the process, the index is refused when several workers serve
+    the app.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        # Only marked loaded once complete; a failed load starts over.
+        self._postings.clear()
+        self._documents.clear()
+        for post in Post.query.yield_per(500):
+            self._add(_documents_for_post(post))
+        for comment in Comment.query.yield_per(500):
+            self._add([_document_for_comment(comment)])
+        self._loaded = True
+
+    def _add(self, documents):
+        for document in documents:
+            key = document[:2]
+            self._remove(key)
+            terms = Counter(tokenize(document[3]) * 3 + tokenize(document[4]))
+            for term, frequency in terms.items():
+                self._postings[term][key] = frequency
+            self._documents[key] = (document, sum(terms.values()), set(terms))
+
+    def _remove(self, key):
+        entry = self._documents.pop(key, None)
+        if entry is not None:
+            for term in entry[2]:
+                self._postings[term].pop(key, None)
+
+    def _remove_post(self, post_id):
+        for key, (document, _, _) in list(self._documents.items()):
+            if document[2] == post_id:
+                self._remove(key)
+
+    def _defer(self, change, *args):
+        db.session.info.setdefault(PENDING, []).append((self, change, args))
+
+    def apply(self, changes):
+        with self._lock:
+            # Not loaded yet: the load reads the committed rows anyway.
+            if self._loaded:
+                for change, args in changes:
+                    change(*args)
+
+    def add(self, documents, replace=True):
+        self._defer(self._add, list(documents))
+
+    def remove(self, kind, ref_id):
+        self._defer(self._remove, (kind, ref_id))
+
+    def remove_post(self, post_id):
+        self._defer(self._remove_post, post_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._loaded = False
+
+    def _candidates(self, terms):
+        keys = None
+        for term, prefix in _rules(terms):
+            found = set()
+            for token, postings in self._postings.items():
+                if _matches(token, term, prefix):
+                    found.update(postings)
+            keys = found if keys is None else keys & found
+        return keys
+
+    def _score(self, key, terms, average_length):
+        # BM25 with the usual k1/b, over the same matches as _candidates.
+        _, length, document_terms = self._documents[key]
+        count = len(self._documents)
+        score = 0.0
+        for term, prefix in _rules(terms):
+            for match in document_terms:
+                if not _matches(match, term, prefix):
+                    continue
+                postings = self._postings[match]
+                rarity = (count - len(postings) + 0.5) / (len(postings) + 0.5)
+                idf = math.log(1 + rarity)
+                frequency = postings[key]
+                score += idf * frequency * 2.2 / (
+                    frequency + 1.2 * (0.25 + 0.75 * length / average_length)
+                )
+        return score
+
+    def _snippet(self, value, terms):
+        words = value.split()
+        if not words:
+            return ""
+        rules = _rules(terms)
+
+        def hit(word):
+            return any(
+                _matches(token, term, prefix)
+                for token in tokenize(word)
+                for term, prefix in rules
+            )
+
+        start = 0
+        for position, word in enumerate(words):
+            if hit(word):
+                start = max(position - SNIPPET_WORDS // 3, 0)
+                break
+        window = words[start : start + SNIPPET_WORDS]
+        marked = [f"{OPEN}{word}{CLOSE}" if hit(word) else word for word in window]
+        prefix = "…" if start else ""
+        suffix = "…" if start + SNIPPET_WORDS < len(words) else ""
+        return prefix + " ".join(marked) + suffix
+
+    def search(self, terms, page, per_page):
+        with self._lock:
+            self._load()
+            keys = self._candidates(terms)
+            if not keys:
+                return [], 0
+            average_length = sum(d[1] for d in self._documents.values()) / len(
+                self._documents
+            )
+            ranked = sorted(
+                keys, key=lambda key: -self._score(key, terms, average_length)
+            )
+            window = ranked[(page - 1) * per_page : page * per_page]
+            hits = []
+            for key in window:
+                kind, ref_id, post_id, title, body = self._documents[key][0]
+                hits.append(
+                    SearchHit(
+                        kind,
+                        ref_id,
+                        post_id,
+                        _highlight(self._snippet(title, terms)),
+                        _highlight(self._snippet(body, terms)),
+                    )
+                )
+            return hits, len(ranked)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    pending = session.info.pop(PENDING, None)
+    if pending:
+        by_index = defaultdict(list)
+        for index, change, args in pending:
+            by_index[index].append((change, args))
+        for index, changes in by_index.items():
+            index.apply(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(PENDING, None)
+
+
+def get_index():
+    index = app.extensions.get("search")
+    if index is None:
+        try:
+            if db.engine.dialect.name != "sqlite":
+                raise OperationalError(None, None, "FTS5 needs SQLite")
+            index = Fts5Index()
+        except OperationalError:
+            if app.config["WEB_CONCURRENCY"] > 1:
+                raise RuntimeError(
+                    "The database has no FTS5, and the in-memory search index "
+                    "would only see each worker's own writes; run a single "
+                    "worker or use SQLite with FTS5"
+                ) from None
+            index = InvertedIndex()
+        app.extensions["search"] = index
+    return index
+
+
+def index_post(post):
+    get_index().add(_documents_for_post(post))
+
+
+def remove_post(post):
+    get_index().remove_post(post.id)
+
+
+def index_comment(comment):
+    get_index().add([_document_for_comment(comment)])
+
+
+def remove_comment(comment):
+    get_index().remove("comment", comment.id)
+
+
+def _batches(documents, size=500):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebuild():
+    index = get_index()
+    index.clear()
+    # The index is empty, so nothing needs replacing.
+    posts = (d for post in Post.query.yield_per(500) for d in _documents_for_post(post))
+    comments = (_document_for_comment(c) for c in Comment.query.yield_per(500))
+    for source in (posts, comments):
+        for batch in _batches(source):
+            index.add(batch, replace=False)
+    db.session.commit()
+
+
+def search(query, page=1, per_page=10):
+    terms = tokenize(query)
+    if not terms:
+        return SearchResults([], 0, page, per_page)
+    hits, total = get_index().search(terms, page, per_page)
+    return SearchResults(hits, total, page, per_page)
@@ -0,0 +1,53 @@
+from collections import namedtuple
+
+from flask import current_app as app
+
+from . import cache, db
+from .models import Post, User
+
+Writer = namedtuple("Writer", "username")
+Article = namedtuple("Article", "title slug author_username")
+
+SIDEBAR_SIZE = 5
+TOP_WRITERS_KEY = "sidebar:top_writers"
+LATEST_ARTICLES_KEY = "sidebar:latest_articles"
+
+
+def _top_writers(limit):
+    rows = (
+        db.session.query(User.username)
+        .order_by(User.post_count.desc(), User.id)
+        .limit(limit)
+    )
+    return [Writer(*row) for row in rows]
+
+
+def _latest_articles(limit):
+    rows = (
+        db.session.query(Post.title, Post.slug, User.username)
+        .join(User, User.id == Post.user_id)
+        .order_by(Post.date_posted.desc(), Post.id.desc())
+        .limit(limit)
+    )
+    return [Article(*row) for row in rows]
+
+
+def top_writers():
+    return cache.get_or_set(
+        TOP_WRITERS_KEY,
+        lambda: _top_writers(SIDEBAR_SIZE),
+        app.config["SIDEBAR_CACHE_TIMEOUT"],
+    )
+
+
+def latest_articles():
+    return cache.get_or_set(
+        LATEST_ARTICLES_KEY,
+        lambda: _latest_articles(SIDEBAR_SIZE),
+        app.config["SIDEBAR_CACHE_TIMEOUT"],
+    )
+
+
+def invalidate():
+    cache.delete(TOP_WRITERS_KEY)
+    cache.delete(LATEST_ARTICLES_KEY)
@@ -0,0 +1,73 @@
+(function () {
+    var thread = document.getElementById("comments")
+    if (!thread) {
+        return
+    }
+    var earlier = document.getElementById("earlier-comments")
+    // Each kind of request has its own in-flight flag, so one finishing
+    // cannot start a second request of the other kind early.
+    var polling = false
+    var loadingEarlier = false
+
+    function fetch(query, onLoad, onDone) {
+        var xhr = new XMLHttpRequest()
+        xhr.open("GET", thread.dataset.url + "?" + query, true)
+        xhr.addEventListener("load", function () {
+            // A 304 from the server reaches us as the cached 200.
+            if (xhr.status === 200) {
+                onLoad(JSON.parse(xhr.responseText))
+            }
+        })
+        xhr.addEventListener("loadend", onDone)
+        xhr.send()
+    }
+
+    function poll() {
+        if (polling || document.hidden) {
+            return
+        }
+        polling = true
+        var query = thread.dataset.latest ? "since=" + encodeURIComponent(thread.dataset.latest) : ""
+        fetch(query, function (response) {
+            if (!response.comments.length) {
+                return
+            }
+            var empty = document.getElementById("no-comments")
+            if (empty) {
+                empty.parentNode.removeChild(empty)
+            }
+            thread.insertAdjacentHTML("beforeend", response.html)
+            thread.dataset.latest = response.latest
+            if (response.more) {
+                setTimeout(poll, 0)
+            }
+        }, function () {
+            polling = false
+        })
+    }
+
+    if (earlier) {
+        earlier.addEventListener("click", function (event) {
+            event.preventDefault()
+            if (loadingEarlier) {
+                return
+            }
+            loadingEarlier = true
+            earlier.classList.add("disabled")
+            fetch("before=" + encodeURIComponent(earlier.dataset.cursor), function (response) {
+                thread.insertAdjacentHTML("afterbegin", response.html)
+                if (response.earlier) {
+                    earlier.dataset.cursor = response.earlier
+                } else {
+                    earlier.parentNode.removeChild(earlier)
+                }
+            }, function () {
+                // Also after a failed request, so the link can be tried again.
+                loadingEarlier = false
+                earlier.classList.remove("disabled")
+            })
+        })
+    }
+
+    setInterval(poll, (parseInt(thread.dataset.poll, 10) || 15) * 1000)
+})();
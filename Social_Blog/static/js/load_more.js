@@ -0,0 +1,35 @@
+(function () {
+    var button = document.getElementById("load-more")
+    if (!button) {
+        return
+    }
+
+    button.addEventListener("click", function (event) {
+        event.preventDefault()
+        if (button.classList.contains("disabled")) {
+            return
+        }
+        button.classList.add("disabled")
+
+        var xhr = new XMLHttpRequest()
+        xhr.open("GET", button.dataset.url + "?cursor=" + encodeURIComponent(button.dataset.cursor), true)
+
+        xhr.addEventListener("load", function () {
+            if (xhr.status !== 200) {
+                button.classList.remove("disabled")
+                return
+            }
+            var response = JSON.parse(xhr.responseText)
+            document.getElementById("posts").insertAdjacentHTML("beforeend", response.html)
+            if (response.next_cursor) {
+                button.dataset.cursor = response.next_cursor
+                button.href = button.href.split("?")[0] + "?cursor=" + encodeURIComponent(response.next_cursor)
+                button.classList.remove("disabled")
+            } else {
+                button.parentNode.removeChild(button)
+            }
+        })
+
+        xhr.send()
+    })
+})();
@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+
+from flask import abort, request, send_from_directory
+
+# Stylesheets and scripts are copied into static/dist under names carrying a
+# hash of their contents, next to gzip and (with the brotli package installed)
+# brotli versions. A changed file gets a new name, so the built files can be
+# cached by browsers for good.
+
+SOURCE_DIRS = ("css", "js")
+FINGERPRINTED = (".css", ".js")
+MANIFEST = "manifest.json"
+ENCODINGS = ((".br", "br"), (".gz", "gzip"))
+
+
+def _compressors():
+    yield ".gz", lambda data: gzip.compress(data, 9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return
+    yield ".br", lambda data: brotli.compress(data, quality=11)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def fingerprint(name, data):
+    """``css/main.css`` becomes ``css/main.<hash>.css``."""
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def build(static_folder, dist):
+    """Fingerprint and compress the assets into ``dist``; return the manifest.
+
+    Outputs that already exist are kept, since a name can only ever hold the
+    same contents, so rebuilding after a restart costs little more than
+    hashing the sources. Older builds are left for pages that still link them.
+    """
+    compressors = list(_compressors())
+    manifest = {}
+    for directory in SOURCE_DIRS:
+        root = os.path.join(static_folder, directory)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                source = os.path.join(dirpath, filename)
+                name = os.path.relpath(source, static_folder).replace(os.sep, "/")
+                with open(source, "rb") as f:
+                    data = f.read()
+                if not name.endswith(FINGERPRINTED):
+                    # Source maps keep their names, which the built files
+                    # point at, and are only fetched by developer tools.
+                    _write(os.path.join(dist, name), data)
+                    continue
+                built = manifest[name] = fingerprint(name, data)
+                target = os.path.join(dist, built)
+                if not os.path.exists(target):
+                    _write(target, data)
+                for suffix, compress in compressors:
+                    if os.path.exists(target + suffix):
+                        continue
+                    compressed = compress(data)
+                    # Not worth it for tiny files; they are served as they are.
+                    if len(compressed) < len(data):
+                        _write(target + suffix, compressed)
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+class Assets:
+    """Serve the built assets, precompressed and cached for a year.
+
+    ``url_for("static", filename="css/main.css")`` gives the fingerprinted
+    URL of any file in the manifest and the plain one for everything else,
+    such as uploaded images. The app only loads the manifest; the build is
+    ``flask assets build``, run once on deploy, or when the app is created
+    with ``ASSETS_BUILD_ON_STARTUP``.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ASSETS_ENABLED", not app.debug)
+        app.config.setdefault("ASSETS_BUILD_ON_STARTUP", False)
+        app.config.setdefault("ASSETS_MAX_AGE", 365 * 24 * 3600)
+        app.config.setdefault("ASSETS_DIST", os.path.join(app.static_folder, "dist"))
+        app.extensions["assets"] = self
+        if not app.config["ASSETS_ENABLED"]:
+            return
+        self.dist = app.config["ASSETS_DIST"]
+        self.max_age = app.config["ASSETS_MAX_AGE"]
+        if app.config["ASSETS_BUILD_ON_STARTUP"]:
+            self.build(app)
+        else:
+            self.load()
+            if not self.manifest:
+                app.logger.warning(
+                    "No built assets in %s, run `flask assets build`", self.dist
+                )
+
+        @app.url_defaults
+        def fingerprinted_static(endpoint, values):
+            if endpoint == "static":
+                built = self.manifest.get(values.get("filename"))
+                if built is not None:
+                    values["filename"] = f"dist/{built}"
+
+        app.add_url_rule(
+            f"{app.static_url_path}/dist/<path:filename>", "assets", self.serve
+        )
+
+    def build(self, app):
+        build(app.static_folder, self.dist)
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.dist, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self.encodings = {}
+        for dirpath, _, filenames in os.walk(self.dist):
+            for filename in filenames:
+                if filename == MANIFEST or filename.endswith((".br", ".gz")):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.dist).replace(os.sep, "/")
+                self.encodings[name] = [
+                    (suffix, encoding)
+                    for suffix, encoding in ENCODINGS
+                    if os.path.exists(path + suffix)
+                ]
+        self.immutable = set(self.manifest.values())
+
+    def serve(self, filename):
+        if filename not in self.encodings:
+            abort(404)
+        accepted = request.accept_encodings
+        suffix, encoding = next(
+            ((s, e) for s, e in self.encodings[filename] if accepted[e]), ("", None)
+        )
+        immutable = filename in self.immutable
+        response = send_from_directory(
+            self.dist,
+            filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0],
+            max_age=self.max_age if immutable else None,
+        )
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from flask import current_app as app
+from flask import send_file
+from werkzeug.utils import import_string, safe_join
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+CONTENT_ADDRESSED = re.compile(r"^(?P<digest>[0-9a-f]{64})-[a-z]+\.[a-z0-9]+$")
+
+
+def hash_to_file(stream, directory):
+    """Copy ``stream`` into a temporary file in ``directory`` while hashing it.
+
+    Returns ``(sha256 hexdigest, temporary path)``.
+    """
+    digest = hashlib.sha256()
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".upload")
+    with os.fdopen(fd, "wb") as out:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest(), path
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        path = safe_join(self.root, name)
+        if path is None:
+            raise ValueError(name)
+        return path
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def save(self, name, source):
+        os.makedirs(self.root, exist_ok=True)
+        target = self.path(name)
+        try:
+            os.replace(source, target)
+        except OSError:
+            # Staging and storage live on different filesystems.
+            shutil.move(source, target + ".part")
+            os.replace(target + ".part", target)
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def send(self, name):
+        match = CONTENT_ADDRESSED.match(name)
+        if match is None:
+            return send_file(self.path(name), conditional=True)
+        # The name is derived from the content, so it can be cached forever
+        # and the digest doubles as a strong validator.
+        response = send_file(
+            self.path(name),
+            conditional=True,
+            etag=name,
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+        response.headers["Cache-Control"] = (
+            f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        )
+        return response
+
+
+def get_storage():
+    storage = app.extensions.get("photo_storage")
+    if storage is None:
+        factory = app.config["PHOTO_STORAGE"]
+        if isinstance(factory, str):
+            factory = import_string(factory)
+        storage = app.extensions["photo_storage"] = factory(
+            app.config["UPLOADED_PHOTOS_DEST"]
+        )
+    return storage
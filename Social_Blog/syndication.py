@@ -0,0 +1,189 @@
+import hashlib
+import json
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from flask import Response
+from flask import current_app as app
+from flask import request, stream_with_context, url_for
+from werkzeug.http import http_date, is_resource_modified
+
+from . import pagecache
+from .feeds import for_listing
+from .models import Post
+
+# RSS, Atom and JSON Feed documents for one writer or the whole site. Feed
+# readers poll, so the validators come from one indexed lookup of the newest
+# post plus the feed's own version tokens, and the listing query only runs
+# once the body is actually sent: a poll that ends in a 304 never loads a
+# post. Edits, deletions and renames change a feed without adding a post, so
+# they bump the site's token and the writer's ("syndication:site",
+# "syndication:user:<id>"); bulk imports bump "syndication:all", which every
+# feed depends on. Comments never appear in a feed and leave them alone.
+
+FORMATS = {
+    "xml": "application/rss+xml",
+    "atom": "application/atom+xml",
+    "json": "application/feed+json",
+}
+
+
+def newest(query):
+    """``(date_posted, id)`` of the newest post in ``query``."""
+    return (
+        query.with_entities(Post.date_posted, Post.id)
+        .order_by(Post.date_posted.desc(), Post.id.desc())
+        .limit(1)
+    )
+
+
+def _post_url(post):
+    return url_for(
+        "post", post_author=post.author.username, post_slug=post.slug, _external=True
+    )
+
+
+def _atom_date(value):
+    return value.replace(microsecond=0).isoformat() + "Z"
+
+
+def _rss(meta, posts):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" '
+    yield 'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>'
+    yield f"<title>{escape(meta['title'])}</title>"
+    yield f"<link>{escape(meta['home'])}</link>"
+    yield f"<description>{escape(meta['description'])}</description>"
+    yield f'<atom:link href={quoteattr(meta["self"])} rel="self" type="{FORMATS["xml"]}"/>'
+    if meta["updated"]:
+        yield f"<lastBuildDate>{http_date(meta['updated'])}</lastBuildDate>"
+    for post in posts:
+        link = escape(_post_url(post))
+        yield (
+            f"<item><title>{escape(post.title)}</title><link>{link}</link>"
+            f'<guid isPermaLink="true">{link}</guid>'
+            f"<pubDate>{http_date(post.date_posted)}</pubDate>"
+            f"<dc:creator>{escape(post.author.username)}</dc:creator>"
+            f"<description>{escape(post.excerpt or '')}</description></item>"
+        )
+    yield "</channel></rss>\n"
+
+
+def _atom(meta, posts):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<feed xmlns="http://www.w3.org/2005/Atom">'
+    yield f"<title>{escape(meta['title'])}</title>"
+    yield f"<subtitle>{escape(meta['description'])}</subtitle>"
+    yield f"<id>{escape(meta['self'])}</id>"
+    yield f'<link rel="self" href={quoteattr(meta["self"])}/>'
+    yield f'<link rel="alternate" href={quoteattr(meta["home"])}/>'
+    if meta["updated"]:
+        yield f"<updated>{_atom_date(meta['updated'])}</updated>"
+    for post in posts:
+        link = _post_url(post)
+        published = _atom_date(post.date_posted)
+        yield (
+            f"<entry><title>{escape(post.title)}</title><id>{escape(link)}</id>"
+            f'<link rel="alternate" href={quoteattr(link)}/>'
+            f"<published>{published}</published><updated>{published}</updated>"
+            f"<author><name>{escape(post.author.username)}</name></author>"
+            f"<summary>{escape(post.excerpt or '')}</summary></entry>"
+        )
+    yield "</feed>\n"
+
+
+def _json(meta, posts):
+    head = {
+        "version": "https://jsonfeed.org/version/1.1",
+        "title": meta["title"],
+        "description": meta["description"],
+        "home_page_url": meta["home"],
+        "feed_url": meta["self"],
+    }
+    yield json.dumps(head)[:-1] + ', "items": ['
+    for i, post in enumerate(posts):
+        link = _post_url(post)
+        item = {
+            "id": link,
+            "url": link,
+            "title": post.title,
+            "summary": post.excerpt or "",
+            "content_text": post.excerpt or "",
+            "date_published": _atom_date(post.date_posted),
+            "authors": [
+                {
+                    "name": post.author.username,
+                    "url": url_for(
+                        "profile", user=post.author.username, _external=True
+                    ),
+                }
+            ],
+        }
+        yield ("," if i else "") + json.dumps(item)
+    yield "]}\n"
+
+
+RENDERERS = {"xml": _rss, "atom": _atom, "json": _json}
+
+
+def versions(author_id=None):
+    """Version tokens the site feed, or ``author_id``'s feed, depends on."""
+    own = f"syndication:user:{author_id}" if author_id else "syndication:site"
+    return ("syndication:all", own)
+
+
+def invalidate(*author_ids):
+    """Change the validators of the site feed and of these writers' feeds."""
+    pagecache.bump(
+        "syndication:site",
+        *(f"syndication:user:{author_id}" for author_id in author_ids),
+    )
+
+
+def invalidate_all():
+    pagecache.bump("syndication:all")
+
+
+def response(format, query, title, description, home, author_id=None):
+    """Stream the newest posts ``query`` selects as a ``format`` feed.
+
+    The response is conditional on the newest post and on the feed's
+    version tokens (see ``versions``); a 304 is sent without running the
+    listing query.
+    """
+    latest = newest(query).first()
+    tokens = [pagecache.version(name) for name in versions(author_id)]
+    updated = None
+    if latest is not None:
+        changed = datetime.utcfromtimestamp(max(tokens) // 10 ** 9)
+        updated = max(latest[0], changed)
+    meta = dict(
+        title=title,
+        description=description,
+        home=home,
+        self=request.base_url,
+        updated=updated,
+    )
+
+    def generate():
+        posts = (
+            for_listing(query)
+            .order_by(Post.date_posted.desc(), Post.id.desc())
+            .limit(app.config["SYNDICATION_ITEMS"])
+        )
+        yield from RENDERERS[format](meta, posts)
+
+    etag = hashlib.sha1(f"{format}:{title}:{latest}:{tokens}".encode("utf-8")).hexdigest()
+    # Decided up front: a streamed body that is never sent (a 304, or a HEAD
+    # request) would keep its request context pushed.
+    modified = is_resource_modified(request.environ, etag, last_modified=updated)
+    body = None
+    if modified and request.method != "HEAD":
+        body = stream_with_context(generate())
+    rv = Response(body, status=200 if modified else 304, mimetype=FORMATS[format])
+    rv.set_etag(etag)
+    if updated is not None:
+        rv.last_modified = updated
+    rv.cache_control.public = True
+    rv.cache_control.max_age = app.config["SYNDICATION_MAX_AGE"]
+    return rv
@@ -0,0 +1,53 @@
+import re
+from html.parser import HTMLParser
+
+WHITESPACE = re.compile(r"\s+")
+BLOCK_TAGS = {"br", "div", "p", "li", "h1", "h2", "h3", "blockquote", "pre", "figure"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def strip_html(html):
+    """Return the visible text of the Trix HTML ``html`` on a single line."""
+    if not html:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return WHITESPACE.sub(" ", "".join(parser.parts)).strip()
+
+
+def excerpt(value, length=300, end="…"):
+    """Cut plain text ``value`` to at most ``length`` characters on a word boundary."""
+    if len(value) <= length:
+        return value
+    cut = value[: length - len(end)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:") + end
+
+
+def reading_time(value, words_per_minute=200):
+    """Estimated minutes to read plain text ``value``, never less than one."""
+    return max(1, round(len(value.split()) / words_per_minute))
@@ -0,0 +1,159 @@
+from flask import current_app as app
+from sqlalchemy import and_, exists, literal, select
+
+from . import db
+from .models import Follow, Post, TimelineEntry, User
+
+# Per-follower inboxes of (user_id, post_id, date_posted). A new post is
+# written into the inbox of every follower and of its author, so reading the
+# followed feed is a range scan on (user_id, date_posted). Posts by authors
+# with more than TIMELINE_FANOUT_LIMIT followers are skipped on write, and the
+# author is marked fanout_skipped; the posts of marked authors are merged in
+# on read. The mark stays when the author drops back under the limit, until
+# their next post writes what was skipped into the inboxes, so no post ever
+# drops out of a feed.
+
+
+def enabled():
+    return app.config["TIMELINE_ENABLED"]
+
+
+def prolific_authors():
+    return select([User.id]).where(
+        User.followers_count > app.config["TIMELINE_FANOUT_LIMIT"]
+    )
+
+
+def is_prolific(user):
+    return user.followers_count > app.config["TIMELINE_FANOUT_LIMIT"]
+
+
+def _insert(rows):
+    columns = ["user_id", "post_id", "date_posted"]
+    db.session.execute(TimelineEntry.__table__.insert().from_select(columns, rows))
+
+
+def _mark_skipped(authors):
+    User.query.filter(
+        User.id.in_(authors),
+        User.followers_count > app.config["TIMELINE_FANOUT_LIMIT"],
+        User.fanout_skipped.is_(False),
+    ).update({User.fanout_skipped: True}, synchronize_session=False)
+
+
+def _catch_up(author_id):
+    """Write every post of ``author_id`` missing from a follower's inbox."""
+    present = exists().where(
+        and_(
+            TimelineEntry.user_id == Follow.follower_id,
+            TimelineEntry.post_id == Post.id,
+        )
+    )
+    missing = (
+        select([Follow.follower_id, Post.id, Post.date_posted])
+        .select_from(Follow.__table__.join(Post, Post.user_id == Follow.followed_id))
+        .where(Follow.followed_id == author_id)
+        .where(~present)
+    )
+    _insert(missing)
+    User.query.filter_by(id=author_id).update(
+        {User.fanout_skipped: False}, synchronize_session=False
+    )
+
+
+def fan_out(post):
+    if not enabled():
+        return
+    own = select(
+        [literal(post.user_id), literal(post.id), literal(post.date_posted)]
+    )
+    if is_prolific(post.author):
+        _insert(own)
+        _mark_skipped([post.user_id])
+        return
+    if post.author.fanout_skipped:
+        # Back under the limit: this covers the new post as well.
+        _insert(own)
+        _catch_up(post.user_id)
+        return
+    followers = select(
+        [Follow.follower_id, literal(post.id), literal(post.date_posted)]
+    ).where(Follow.followed_id == post.user_id)
+    _insert(followers.union_all(own))
+
+
+def fan_out_posts(post_ids):
+    """Do what fan_out() does for many posts at once."""
+    if not enabled() or not post_ids:
+        return
+    new = Post.id.in_(post_ids)
+    followers = (
+        select([Follow.follower_id, Post.id, Post.date_posted])
+        .select_from(Follow.__table__.join(Post, Post.user_id == Follow.followed_id))
+        .where(new)
+        .where(Follow.followed_id.notin_(prolific_authors()))
+    )
+    own = select([Post.user_id, Post.id, Post.date_posted]).where(new)
+    _insert(followers.union_all(own))
+    _mark_skipped(select([Post.user_id]).where(new))
+
+
+def backfill(follower, followed):
+    # A marked author's posts are merged in on read.
+    if not enabled() or followed.fanout_skipped:
+        return
+    posts = select([literal(follower.id), Post.id, Post.date_posted]).where(
+        Post.user_id == followed.id
+    )
+    _insert(posts)
+
+
+def prune(follower, followed):
+    if not enabled():
+        return
+    posts = select([Post.id]).where(Post.user_id == followed.id)
+    TimelineEntry.query.filter(
+        TimelineEntry.user_id == follower.id, TimelineEntry.post_id.in_(posts)
+    ).delete(synchronize_session=False)
+
+
+def remove_post(post):
+    if not enabled():
+        return
+    TimelineEntry.query.filter_by(post_id=post.id).delete(synchronize_session=False)
+
+
+def rebuild():
+    TimelineEntry.query.delete(synchronize_session=False)
+    followed = (
+        select([Follow.follower_id, Post.id, Post.date_posted])
+        .select_from(Follow.__table__.join(Post, Post.user_id == Follow.followed_id))
+        .where(Follow.followed_id.notin_(prolific_authors()))
+    )
+    own = select([Post.user_id, Post.id, Post.date_posted])
+    _insert(followed.union(own))
+    User.query.update(
+        {
+            User.fanout_skipped: User.followers_count
+            > app.config["TIMELINE_FANOUT_LIMIT"]
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+
+def feed_query(user):
+    """Return ``(query, keys)`` for the followed feed read from the inbox."""
+    inbox = Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id).filter(
+        TimelineEntry.user_id == user.id
+    )
+    prolific = [
+        followed_id
+        for (followed_id,) in db.session.query(Follow.followed_id)
+        .join(User, User.id == Follow.followed_id)
+        .filter(Follow.follower_id == user.id, User.fanout_skipped.is_(True))
+    ]
+    if not prolific:
+        return inbox, (TimelineEntry.date_posted, TimelineEntry.post_id)
+    on_read = Post.query.filter(Post.user_id.in_(prolific))
+    return inbox.union(on_read), (Post.date_posted, Post.id)
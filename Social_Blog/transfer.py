@@ -0,0 +1,405 @@
+import json
+import secrets
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app as app
+
+from . import db, passwords, search, timeline
+from .models import Comment, Follow, Post, User, adjust_counts
+
+# Users, posts, comments and follows as newline-delimited JSON, one record per
+# line, tagged with its "type". Records point at each other by username and
+# post slug rather than by id, so a dump can be loaded into another database.
+# Both directions work a batch at a time: export streams rows off the cursor
+# and import keeps at most TRANSFER_BATCH_SIZE records of each type in memory,
+# whatever the size of the dump.
+
+TYPES = ("user", "post", "comment", "follow")
+
+
+class InvalidRecord(ValueError):
+    """A line of the dump is not a record this module can read."""
+
+
+class TooLarge(InvalidRecord):
+    """The dump is longer than the caller allows."""
+
+
+def limited_lines(stream, limit):
+    """Lines of the binary ``stream``, raising ``TooLarge`` past ``limit`` bytes.
+
+    Counted while reading, since a chunked request body has no length to
+    check up front; no line is read further than the limit either.
+    """
+    remaining = limit
+    while True:
+        line = stream.readline(remaining + 1)
+        if not line:
+            return
+        remaining -= len(line)
+        if remaining < 0:
+            raise TooLarge(f"more than {limit} bytes")
+        yield line
+
+
+def _date(value):
+    return value.isoformat() if value is not None else None
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value) if value else datetime.utcnow()
+
+
+def _rows(query):
+    return query.yield_per(app.config["TRANSFER_BATCH_SIZE"])
+
+
+def export_records(author=None):
+    """Yield every record, or only ``author``'s profile, posts and their comments.
+
+    A writer's own export leaves out email addresses and password hashes.
+    """
+    users = db.session.query(
+        User.username, User.email, User.password, User.bio, User.image_file
+    ).order_by(User.id)
+    if author is not None:
+        users = users.filter(User.id == author.id)
+    for username, email, password, bio, image_file in _rows(users):
+        record = dict(type="user", username=username, bio=bio, image_file=image_file)
+        if author is None:
+            record.update(email=email, password=password)
+        yield record
+
+    posts = (
+        db.session.query(
+            User.username, Post.title, Post.slug, Post.content, Post.date_posted
+        )
+        .join(User, User.id == Post.user_id)
+        .order_by(Post.id)
+    )
+    if author is not None:
+        posts = posts.filter(Post.user_id == author.id)
+    for username, title, slug, content, date_posted in _rows(posts):
+        yield dict(
+            type="post",
+            author=username,
+            title=title,
+            slug=slug,
+            content=content,
+            date_posted=_date(date_posted),
+        )
+
+    post_author = db.aliased(User)
+    comments = (
+        db.session.query(
+            Post.slug,
+            post_author.username,
+            User.username,
+            Comment.body,
+            Comment.date_posted,
+        )
+        .join(Post, Post.id == Comment.post_id)
+        .join(post_author, post_author.id == Post.user_id)
+        .join(User, User.id == Comment.author_id)
+        .order_by(Comment.id)
+    )
+    if author is not None:
+        comments = comments.filter(Post.user_id == author.id)
+    for slug, post_username, username, body, date_posted in _rows(comments):
+        yield dict(
+            type="comment",
+            post=slug,
+            post_author=post_username,
+            author=username,
+            body=body,
+            date_posted=_date(date_posted),
+        )
+
+    if author is not None:
+        return
+    follower = db.aliased(User)
+    followed = db.aliased(User)
+    follows = (
+        db.session.query(follower.username, followed.username, Follow.timestamp)
+        .join(follower, follower.id == Follow.follower_id)
+        .join(followed, followed.id == Follow.followed_id)
+        .order_by(Follow.follower_id, Follow.followed_id)
+    )
+    for follower_name, followed_name, timestamp in _rows(follows):
+        yield dict(
+            type="follow",
+            follower=follower_name,
+            followed=followed_name,
+            timestamp=_date(timestamp),
+        )
+
+
+def export_lines(author=None):
+    for record in export_records(author):
+        yield json.dumps(record) + "\n"
+
+
+def _ids(model, column, values):
+    """Map each of ``values`` found in ``column`` to its row id, in one query."""
+    values = set(values)
+    if not values:
+        return {}
+    rows = db.session.query(column, model.id).filter(column.in_(values))
+    return dict(rows)
+
+
+def _existing(column, values):
+    values = set(values)
+    if not values:
+        return set()
+    return {value for value, in db.session.query(column).filter(column.in_(values))}
+
+
+class Importer:
+    """Bulk load records read from a dump.
+
+    With ``author`` set, only that writer's posts are loaded (as theirs) and
+    every other record is skipped; their counters, followers' timelines and
+    the search index are brought up to date as each batch is written. A full
+    import leaves that to ``finish()``, which rebuilds them once at the end,
+    as the records a timeline is made of arrive in any order.
+    """
+
+    def __init__(self, author=None, batch_size=None):
+        self.author = author
+        self.batch_size = batch_size or app.config["TRANSFER_BATCH_SIZE"]
+        self.pending = {kind: [] for kind in TYPES}
+        self.imported = Counter()
+        self.skipped = Counter()
+        # (author, slug) of the posts in the last batch whose slug was taken
+        # by another writer's post, so comments in the same flush find them.
+        self.renamed = {}
+        self._password = None
+
+    def feed(self, lines):
+        """Read records from an iterable of NDJSON lines."""
+        for number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                kind = record["type"]
+            except (ValueError, TypeError, KeyError) as e:
+                raise InvalidRecord(f"line {number}: not a record ({e})") from None
+            if kind not in self.pending or (self.author and kind != "post"):
+                self.skipped[str(kind)] += 1
+                continue
+            self.pending[kind].append(record)
+            if len(self.pending[kind]) >= self.batch_size:
+                self.flush(kind)
+        return self
+
+    def flush(self, until=TYPES[-1]):
+        # A batch may point at records still waiting in earlier types'
+        # buffers, so those go first.
+        for kind in TYPES[: TYPES.index(until) + 1]:
+            records, self.pending[kind] = self.pending[kind], []
+            if records:
+                try:
+                    getattr(self, f"_import_{kind}s")(records)
+                except KeyError as e:
+                    db.session.rollback()
+                    raise InvalidRecord(f"{kind} record without {e}") from None
+                except (TypeError, ValueError) as e:
+                    db.session.rollback()
+                    raise InvalidRecord(f"bad {kind} record ({e})") from None
+                db.session.commit()
+
+    def finish(self):
+        """Write what is left and refresh the data derived from the imports."""
+        self.flush()
+        if self.author is None and sum(self.imported.values()):
+            User.recount()
+            Post.recount()
+            db.session.commit()
+            timeline.rebuild()
+            search.rebuild()
+        return self.summary()
+
+    def summary(self):
+        return dict(imported=dict(+self.imported), skipped=dict(+self.skipped))
+
+    def _insert(self, kind, model, rows, skipped):
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+        self.imported[kind] += len(rows)
+        self.skipped[kind] += skipped
+
+    def _unknown_password(self):
+        # One hash of a secret nobody keeps; such users reset their password.
+        if self._password is None:
+            self._password = passwords.hash_password(secrets.token_urlsafe(32))
+        return self._password
+
+    def _import_users(self, records):
+        taken = _existing(User.username, (r["username"] for r in records))
+        taken |= _existing(User.email, (r.get("email") for r in records))
+        rows = []
+        for r in records:
+            if r["username"] in taken or not r.get("email") or r["email"] in taken:
+                continue
+            taken.update((r["username"], r["email"]))
+            # A hash bcrypt cannot read would fail every sign-in with an error.
+            password = r.get("password")
+            row = dict(
+                username=r["username"],
+                email=r["email"],
+                password=(
+                    password if passwords.is_hash(password) else self._unknown_password()
+                ),
+            )
+            for optional in ("bio", "image_file"):
+                if r.get(optional):
+                    row[optional] = r[optional]
+            rows.append(row)
+        self._insert("user", User, rows, len(records) - len(rows))
+
+    def _slugs(self, posts, names):
+        """Give every post a slug no other post has, checking a batch at once."""
+        self.renamed = {}
+        wanted = {id(post): post.slug for post in posts}
+        taken = _existing(Post.slug, wanted.values())
+        while True:
+            clashes = []
+            seen = set()
+            for post in posts:
+                if post.slug in taken or post.slug in seen:
+                    clashes.append(post)
+                seen.add(post.slug)
+            if not clashes:
+                break
+            for post in clashes:
+                post.create_slug()
+            taken |= _existing(Post.slug, (post.slug for post in clashes))
+        for post in posts:
+            if post.slug != wanted[id(post)]:
+                self.renamed[names[post.user_id], wanted[id(post)]] = post.slug
+
+    def _import_posts(self, records):
+        if self.author is not None:
+            authors = {r.get("author"): self.author.id for r in records}
+        else:
+            authors = _ids(User, User.username, (r["author"] for r in records))
+        # A post that is already there under the same slug and writer was
+        # imported before, e.g. from an export of this very site.
+        existing = set(
+            db.session.query(Post.user_id, Post.slug).filter(
+                Post.slug.in_({r["slug"] for r in records if r.get("slug")})
+            )
+        )
+        posts = []
+        for r in records:
+            if r.get("author") not in authors or not r.get("title"):
+                continue
+            if r.get("slug"):
+                key = (authors[r.get("author")], r["slug"])
+                if key in existing:
+                    continue
+                existing.add(key)
+            post = Post(
+                title=r["title"],
+                content=r.get("content") or "",
+                date_posted=_parse_date(r.get("date_posted")),
+                user_id=authors[r.get("author")],
+            )
+            if r.get("slug"):
+                post.slug = r["slug"]
+            else:
+                post.create_slug()
+            post.refresh_summary()
+            posts.append(post)
+        names = {user_id: name for name, user_id in authors.items()}
+        self._slugs(posts, names)
+        columns = (
+            "title",
+            "slug",
+            "content",
+            "excerpt",
+            "reading_time",
+            "date_posted",
+            "user_id",
+        )
+        rows = [{name: getattr(post, name) for name in columns} for post in posts]
+        self._insert("post", Post, rows, len(records) - len(rows))
+        if self.author is not None and rows:
+            ids = list(_ids(Post, Post.slug, (row["slug"] for row in rows)).values())
+            adjust_counts(User, self.author.id, post_count=len(ids))
+            timeline.fan_out_posts(ids)
+            for post in Post.query.filter(Post.id.in_(ids)):
+                search.index_post(post)
+
+    def _import_comments(self, records):
+        for r in records:
+            r["post"] = self.renamed.get((r.get("post_author"), r["post"]), r["post"])
+        posts = {
+            slug: (post_id, user_id)
+            for slug, post_id, user_id in db.session.query(
+                Post.slug, Post.id, Post.user_id
+            ).filter(Post.slug.in_({r["post"] for r in records}))
+        }
+        authors = _ids(
+            User,
+            User.username,
+            [r["author"] for r in records]
+            + [r["post_author"] for r in records if r.get("post_author")],
+        )
+        # Comments already there from an earlier import of the same dump.
+        existing = set(
+            db.session.query(
+                Comment.post_id, Comment.author_id, Comment.date_posted
+            ).filter(Comment.post_id.in_({post_id for post_id, _ in posts.values()}))
+        )
+        rows = []
+        for r in records:
+            if r["post"] not in posts or r["author"] not in authors or not r.get("body"):
+                continue
+            post_id, post_user_id = posts[r["post"]]
+            # The slug may now belong to another writer's post, if this
+            # comment's post was renamed in an earlier batch.
+            if r.get("post_author") and authors.get(r["post_author"]) != post_user_id:
+                continue
+            row = dict(
+                body=r["body"],
+                date_posted=_parse_date(r.get("date_posted")),
+                post_id=post_id,
+                author_id=authors[r["author"]],
+            )
+            key = (row["post_id"], row["author_id"], row["date_posted"])
+            if key in existing:
+                continue
+            existing.add(key)
+            rows.append(row)
+        self._insert("comment", Comment, rows, len(records) - len(rows))
+
+    def _import_follows(self, records):
+        ids = _ids(
+            User,
+            User.username,
+            [r["follower"] for r in records] + [r["followed"] for r in records],
+        )
+        pairs = {}
+        for r in records:
+            pair = ids.get(r["follower"]), ids.get(r["followed"])
+            if None not in pair and pair[0] != pair[1]:
+                pairs.setdefault(pair, _parse_date(r.get("timestamp")))
+        if pairs:
+            followers = {follower for follower, _ in pairs}
+            existing = db.session.query(Follow.follower_id, Follow.followed_id).filter(
+                Follow.follower_id.in_(followers),
+                Follow.followed_id.in_({followed for _, followed in pairs}),
+            )
+            for pair in existing:
+                pairs.pop(tuple(pair), None)
+        rows = [
+            dict(follower_id=follower, followed_id=followed, timestamp=timestamp)
+            for (follower, followed), timestamp in pairs.items()
+        ]
+        self._insert("follow", Follow, rows, len(records) - len(rows))
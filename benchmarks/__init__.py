@@ -0,0 +1,4 @@
+"""Request benchmarks for the main pages.
+
+Run ``python -m benchmarks --help`` from the repository root.
+"""
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from config import Config
+
+from .harness import ServerDriver, TestClientDriver, run
+
+DRIVERS = {"test-client": TestClientDriver, "server": ServerDriver}
+COLUMNS = (
+    ("route", "<10", ""),
+    ("p50_ms", ">9", ".2f"),
+    ("p99_ms", ">9", ".2f"),
+    ("queries", ">8", ""),
+    ("peak_rss_mb", ">12", ".1f"),
+    ("errors", ">7", ""),
+)
+
+
+def make_app(database, timeline):
+    from Social_Blog import create_app
+
+    class BenchmarkConfig(Config):
+        SECRET_KEY = "benchmark"
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+        SQLALCHEMY_BINDS = None
+        WTF_CSRF_ENABLED = False
+        CACHE_TYPE = "simple"
+        TIMELINE_ENABLED = timeline
+        IMAGE_WORKERS = 0
+        MAIL_OUTBOX_THREAD = False
+
+    return create_app(BenchmarkConfig)
+
+
+def print_table(title, results):
+    print(f"\n{title}")
+    print(" ".join(format(name, align) for name, align, _ in COLUMNS))
+    for row in results:
+        print(
+            " ".join(
+                format(format(row[name], spec), align) for name, align, spec in COLUMNS
+            )
+        )
+
+
+def regressions(report, baseline, tolerance):
+    """Routes whose p99 latency or query count grew past the baseline."""
+    found = []
+    for driver, results in report["drivers"].items():
+        before = {row["route"]: row for row in baseline["drivers"].get(driver, [])}
+        for row in results:
+            old = before.get(row["route"])
+            if old is None:
+                continue
+            if row["queries"] > old["queries"]:
+                found.append(f"{driver} {row['route']}: {old['queries']} -> {row['queries']} queries")
+            if row["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+                found.append(
+                    f"{driver} {row['route']}: p99 {old['p99_ms']:.2f} -> {row['p99_ms']:.2f} ms"
+                )
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=5000)
+    parser.add_argument("--follows-per-user", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=100, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--driver", choices=[*DRIVERS, "both"], default="both")
+    parser.add_argument("--timeline", action="store_true", help="read the followed feed from the timeline")
+    parser.add_argument("--database", help="reuse this SQLite file instead of generating a new one")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare against a report written by --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p99 growth over the baseline")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="devwrites-bench-")
+    database = args.database or os.path.join(workdir, "bench.db")
+    generate = not os.path.exists(database)
+    app = make_app(database, args.timeline)
+    if generate:
+        from Social_Blog import db
+
+        from .data import generate as generate_data
+
+        with app.app_context():
+            db.create_all()
+            counts = generate_data(
+                users=args.users,
+                posts=args.posts,
+                comments=args.comments,
+                follows_per_user=args.follows_per_user,
+                seed=args.seed,
+            )
+        print("Generated", ", ".join(f"{n} {name}" for name, n in counts.items()), f"in {database}")
+
+    drivers = DRIVERS if args.driver == "both" else {args.driver: DRIVERS[args.driver]}
+    report = {"requests": args.requests, "timeline": args.timeline, "drivers": {}}
+    for name, driver_class in drivers.items():
+        results = run(app, driver_class, requests=args.requests, warmup=args.warmup)
+        report["drivers"][name] = results
+        print_table(name, results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        if found:
+            print("\nRegressions:\n  " + "\n  ".join(found))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
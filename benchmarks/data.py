@@ -0,0 +1,159 @@
+"""Synthetic data for the benchmarks.
+
+Users follow each other along a power law, so a few writers have most of the
+followers, and comments pile up on a few popular posts, the way they do on
+the real site.
+"""
+import bisect
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from Social_Blog import bcrypt, db, search, timeline
+from Social_Blog.models import Comment, Follow, Post, User
+from Social_Blog.text import excerpt, reading_time, strip_html
+
+PASSWORD = "benchmark"
+BATCH_SIZE = 1000
+
+WORDS = (
+    "flask python request query index cache session template route database "
+    "worker deploy latency commit branch review refactor test async thread "
+    "process memory profile benchmark feature article writer reader comment "
+    "follow timeline search migration schema column server client browser"
+).split()
+
+
+def _sentence(rng, words=(6, 18)):
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(*words)))
+    return text.capitalize() + "."
+
+
+def trix_html(rng, paragraphs=(3, 12)):
+    """A post body shaped like what the Trix editor produces."""
+    blocks = []
+    for _ in range(rng.randint(*paragraphs)):
+        kind = rng.random()
+        if kind < 0.1:
+            blocks.append(f"<h1>{_sentence(rng, (2, 6))}</h1>")
+        elif kind < 0.2:
+            items = "".join(f"<li>{_sentence(rng, (3, 8))}</li>" for _ in range(3))
+            blocks.append(f"<ul>{items}</ul>")
+        elif kind < 0.28:
+            code = "\n".join(_sentence(rng, (3, 8)) for _ in range(4))
+            blocks.append(f"<pre>{code}</pre>")
+        elif kind < 0.33:
+            blocks.append(f"<blockquote>{_sentence(rng)}</blockquote>")
+        else:
+            sentences = " ".join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+            blocks.append(
+                f"<div>{sentences} <strong>{rng.choice(WORDS)}</strong> "
+                f"<a href=\"https://example.com/{rng.choice(WORDS)}\">"
+                f"{rng.choice(WORDS)}</a><br></div>"
+            )
+    return "".join(blocks)
+
+
+class _PowerLaw:
+    """Draws indexes in ``range(n)`` with weight ``1 / (rank + 1) ** alpha``."""
+
+    def __init__(self, n, alpha, rng):
+        self.rng = rng
+        self.cumulative = list(
+            itertools.accumulate(1 / (rank + 1) ** alpha for rank in range(n))
+        )
+
+    def draw(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return bisect.bisect_left(self.cumulative, point)
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start : start + BATCH_SIZE])
+
+
+def generate(users=200, posts=2000, comments=5000, follows_per_user=20, seed=1):
+    """Fill the current app's (empty) database and return the row counts."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    password = bcrypt.generate_password_hash(PASSWORD).decode("utf-8")
+
+    _insert(
+        User.__table__,
+        [
+            dict(
+                id=i,
+                username=f"writer{i}",
+                email=f"writer{i}@example.com",
+                image_file="default.jpg",
+                bio="Developer and Technical Writer",
+                password=password,
+            )
+            for i in range(1, users + 1)
+        ],
+    )
+
+    popularity = _PowerLaw(users, 1.1, rng)
+    edges = set()
+    for follower in range(1, users + 1):
+        wanted = min(int(rng.paretovariate(1.5) * follows_per_user / 3), users - 1)
+        for _ in range(wanted * 3):
+            if wanted == 0:
+                break
+            followed = popularity.draw() + 1
+            if followed != follower and (follower, followed) not in edges:
+                edges.add((follower, followed))
+                wanted -= 1
+    _insert(
+        Follow.__table__,
+        [
+            dict(
+                follower_id=follower,
+                followed_id=followed,
+                timestamp=now - timedelta(minutes=rng.randint(0, 525600)),
+            )
+            for follower, followed in edges
+        ],
+    )
+
+    post_rows = []
+    for i in range(1, posts + 1):
+        title = _sentence(rng, (3, 9))[:-1]
+        content = trix_html(rng)
+        plain = strip_html(content)
+        post_rows.append(
+            dict(
+                id=i,
+                title=title,
+                slug=f"post-{i}",
+                content=content,
+                excerpt=excerpt(plain),
+                reading_time=reading_time(plain),
+                date_posted=now - timedelta(minutes=rng.randint(0, 525600)),
+                user_id=popularity.draw() + 1,
+            )
+        )
+    _insert(Post.__table__, post_rows)
+
+    hot_posts = _PowerLaw(posts, 0.9, rng)
+    _insert(
+        Comment.__table__,
+        [
+            dict(
+                id=i,
+                body=_sentence(rng),
+                date_posted=now - timedelta(minutes=rng.randint(0, 525600)),
+                author_id=rng.randint(1, users),
+                post_id=hot_posts.draw() + 1,
+            )
+            for i in range(1, comments + 1)
+        ],
+    )
+
+    User.recount()
+    Post.recount()
+    db.session.commit()
+    timeline.rebuild()
+    search.rebuild()
+    return dict(users=users, posts=posts, comments=comments, follows=len(edges))
@@ -0,0 +1,170 @@
+import http.cookiejar
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from Social_Blog import db
+from Social_Blog.models import Follow, Post, User
+from Social_Blog.querycount import QueryCounter
+
+from .data import PASSWORD
+
+
+def peak_rss():
+    """Peak resident set size of this process, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def routes():
+    """Paths exercised by the benchmark, picked from the generated data."""
+    popular = User.query.order_by(User.followers_count.desc(), User.id).first()
+    busiest = Post.query.order_by(Post.comment_count.desc(), Post.id).first()
+    viewer = (
+        db.session.query(Follow.follower_id)
+        .group_by(Follow.follower_id)
+        .order_by(db.func.count().desc(), Follow.follower_id)
+        .limit(1)
+        .scalar()
+    )
+    viewer = User.query.get(viewer) if viewer else popular
+    return viewer, [
+        ("home", "/home"),
+        ("explore", "/explore"),
+        ("post", f"/{busiest.author.username}/{busiest.slug}"),
+        ("profile", f"/{popular.username}"),
+        ("followers", f"/{popular.username}/followers"),
+    ]
+
+
+class TestClientDriver:
+    """Requests go through the Flask test client, in this thread."""
+
+    name = "test-client"
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def login(self, email):
+        self.client.post("/login", data={"email": email, "password": PASSWORD})
+
+    def show_followed(self):
+        self.client.get("/home/followed")
+
+    def get(self, path):
+        response = self.client.get(path)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ServerDriver:
+    """Requests go over HTTP to a real WSGI server running in a thread."""
+
+    name = "wsgi-server"
+
+    def __init__(self, app):
+        self.server = make_server(
+            "127.0.0.1", 0, app, threaded=True, request_handler=_QuietHandler
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def _open(self, path, data=None):
+        if data is not None:
+            data = urllib.parse.urlencode(data).encode("ascii")
+        try:
+            with self.opener.open(self.base + path, data) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def login(self, email):
+        self._open("/login", {"email": email, "password": PASSWORD})
+
+    def show_followed(self):
+        self._open("/home/followed")
+
+    def get(self, path):
+        return self._open(path)
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+
+
+class RouteStats:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        self.peak_rss = 0
+
+    def as_dict(self):
+        return dict(
+            route=self.name,
+            path=self.path,
+            requests=len(self.latencies),
+            errors=self.errors,
+            p50_ms=percentile(self.latencies, 0.5) * 1000,
+            p99_ms=percentile(self.latencies, 0.99) * 1000,
+            queries=max(self.queries),
+            peak_rss_mb=self.peak_rss / 2 ** 20,
+        )
+
+
+def run(app, driver_class, requests=100, warmup=5):
+    """Time every route with ``driver_class`` and return one dict per route."""
+    with app.app_context():
+        viewer, paths = routes()
+        email = viewer.email
+        engine = db.engine
+    driver = driver_class(app)
+    try:
+        driver.login(email)
+        driver.show_followed()
+        results = []
+        for name, path in paths:
+            stats = RouteStats(name, path)
+            for _ in range(warmup):
+                driver.get(path)
+            for _ in range(requests):
+                with QueryCounter(engine) as counter:
+                    started = time.perf_counter()
+                    status = driver.get(path)
+                    stats.latencies.append(time.perf_counter() - started)
+                stats.queries.append(counter.count)
+                if status != 200:
+                    stats.errors += 1
+            stats.peak_rss = peak_rss()
+            results.append(stats.as_dict())
+        return results
+    finally:
+        driver.close()
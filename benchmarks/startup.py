@@ -0,0 +1,208 @@
+"""Worker boot time and memory sharing between forked workers.
+
+``python -m benchmarks.startup`` boots the app in fresh interpreters to time
+the imports and ``create_app()``, then loads it once in this process and forks
+workers from it, the way a pre-forking server with ``--preload`` does. Each
+worker serves the benchmark routes and reports how much of its memory is
+still shared with the parent and how many pooled connections it inherited.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+# Nothing from the app is imported at the top: ``--boot-once`` times that.
+
+# Modules a web worker should not need to import at startup.
+HEAVY = ("alembic", "flask_migrate", "PIL", "Social_Blog.commands")
+
+
+def startup_config(database):
+    from config import Config
+
+    class StartupConfig(Config):
+        SECRET_KEY = "benchmark"
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+        SQLALCHEMY_BINDS = None
+        WTF_CSRF_ENABLED = False
+        CACHE_TYPE = "simple"
+        IMAGE_WORKERS = 0
+        # A worker's own process pool would hold its report pipe open.
+        PASSWORD_HASH_WORKERS = 0
+        MAIL_OUTBOX_THREAD = False
+
+    return StartupConfig
+
+
+def memory():
+    """Resident, shared and private memory of this process, in MB (Linux)."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return {}
+    kb = {}
+    for line in lines[1:]:
+        name, value = line.split(":", 1)
+        kb[name] = int(value.split()[0])
+    return {
+        "rss_mb": kb["Rss"] / 1024,
+        "shared_mb": (kb["Shared_Clean"] + kb["Shared_Dirty"]) / 1024,
+        "private_mb": (kb["Private_Clean"] + kb["Private_Dirty"]) / 1024,
+    }
+
+
+def boot_once(database):
+    """Print what one cold start cost; runs in its own interpreter."""
+    started = time.perf_counter()
+    from Social_Blog import create_app
+
+    create_app(startup_config(database))
+    boot_ms = (time.perf_counter() - started) * 1000
+    heavy = [name for name in HEAVY if name in sys.modules]
+    print(json.dumps(dict(boot_ms=boot_ms, heavy=heavy, **memory())))
+
+
+def cold_starts(database, runs):
+    results = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--boot-once", database],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(out.splitlines()[-1])
+        result["process_ms"] = (time.perf_counter() - started) * 1000
+        results.append(result)
+    return results
+
+
+def _serve(app, requests):
+    from Social_Blog import db
+
+    from .harness import TestClientDriver, routes
+
+    with app.app_context():
+        # NullPool, SQLite's default for files, never keeps any.
+        checkedin = getattr(db.engine.pool, "checkedin", None)
+        inherited = checkedin() if checkedin else 0
+        viewer, paths = routes()
+        email = viewer.email
+    driver = TestClientDriver(app)
+    driver.login(email)
+    errors = 0
+    for _ in range(requests):
+        for _, path in paths:
+            errors += driver.get(path) != 200
+    return dict(inherited_connections=inherited, errors=errors, **memory())
+
+
+def forked_workers(app, workers, requests):
+    """Fork ``workers`` children of this process and collect their reports."""
+    from Social_Blog import db
+
+    from .harness import routes
+
+    with app.app_context():
+        # Leave a connection in the pool, as a preloading master may.
+        routes()
+    children = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            try:
+                with os.fdopen(write, "w") as out:
+                    json.dump(_serve(app, requests), out)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(0)
+        os.close(write)
+        children.append((pid, read))
+    results = []
+    for pid, read in children:
+        with os.fdopen(read) as f:
+            data = f.read()
+        os.waitpid(pid, 0)
+        results.append(json.loads(data) if data else {"errors": 1})
+    with app.app_context():
+        db.session.remove()
+    return results
+
+
+def _mean(results, name):
+    values = [r[name] for r in results if name in r]
+    return sum(values) / len(values) if values else float("nan")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.startup", description=__doc__
+    )
+    parser.add_argument("--runs", type=int, default=10, help="cold starts to time")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20, help="rounds of the routes per worker")
+    parser.add_argument("--database", help="reuse this SQLite file instead of generating a new one")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--boot-once", metavar="DATABASE", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.boot_once:
+        boot_once(args.boot_once)
+        return 0
+
+    from .harness import percentile
+
+    workdir = tempfile.mkdtemp(prefix="devwrites-startup-")
+    database = args.database or os.path.join(workdir, "startup.db")
+    generate = not os.path.exists(database)
+
+    cold = cold_starts(database, args.runs)
+    boot = [r["boot_ms"] for r in cold]
+    process = [r["process_ms"] for r in cold]
+    print(f"cold start ({args.runs} runs)")
+    print(f"  create_app   p50 {percentile(boot, 0.5):8.1f} ms   max {max(boot):8.1f} ms")
+    print(f"  interpreter  p50 {percentile(process, 0.5):8.1f} ms   max {max(process):8.1f} ms")
+    if "rss_mb" in cold[0]:
+        print(f"  rss after boot {_mean(cold, 'rss_mb'):.1f} MB")
+    print(f"  heavy modules loaded: {', '.join(cold[0]['heavy']) or 'none'}")
+
+    from Social_Blog import create_app, db
+
+    app = create_app(startup_config(database))
+    if generate:
+        from .data import generate as generate_data
+
+        with app.app_context():
+            db.create_all()
+            generate_data(users=50, posts=300, comments=600, follows_per_user=10)
+
+    workers = forked_workers(app, args.workers, args.requests)
+    print(f"\nforked workers ({args.workers}, {args.requests} rounds of the routes each)")
+    print(f"  inherited pooled connections {sum(r.get('inherited_connections', 0) for r in workers)}")
+    print(f"  errors {sum(r['errors'] for r in workers)}")
+    if "rss_mb" in workers[0]:
+        for name in ("rss_mb", "shared_mb", "private_mb"):
+            print(f"  {name:<11} mean {_mean(workers, name):8.1f}")
+
+    if args.json:
+        report = {
+            "cold_starts": cold,
+            "boot_ms_p50": percentile(boot, 0.5),
+            "workers": workers,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
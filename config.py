@@ -13,14 +13,81 @@ class Config:
     SECRET_KEY = environ.get("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = environ.get("SQLALCHEMY_DATABASE_URI")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_BINDS = (
+        {"replica": environ["SQLALCHEMY_REPLICA_URI"]}
+        if environ.get("SQLALCHEMY_REPLICA_URI")
+        else None
+    )
     MAIL_SERVER = environ.get("MAIL_SERVER")
-    MAIL_PORT = 465
-    MAIL_USE_SSL = True
+    MAIL_PORT = int(environ.get("MAIL_PORT", 465))
+    MAIL_USE_SSL = environ.get("MAIL_USE_SSL", "1") == "1"
     MAIL_USERNAME = environ.get("MAIL_USERNAME")
     MAIL_PASSWORD = environ.get("MAIL_PASSWORD")
+    MAIL_OUTBOX_THREAD = environ.get("MAIL_OUTBOX_THREAD") == "1"
+    MAIL_OUTBOX_BATCH_SIZE = 50
+    MAIL_OUTBOX_POLL_INTERVAL = 5
+    MAIL_OUTBOX_MAX_ATTEMPTS = 8
+    MAIL_OUTBOX_BACKOFF = 30
+    MAIL_OUTBOX_MAX_BACKOFF = 60 * 60
+    # How long a consumer may hold messages it claimed before another one
+    # takes them over.
+    MAIL_OUTBOX_LEASE = 10 * 60
+    POSTS_PER_PAGE = 5
+    FOLLOWS_PER_PAGE = 30
+    COMMENTS_PER_PAGE = 20
+    COMMENTS_POLL_SECONDS = 15
+    FOLLOWS_BULK_LIMIT = 100
+    SEARCH_PER_PAGE = 10
+    # Worker processes serving the app; gunicorn reads the same variable.
+    WEB_CONCURRENCY = int(environ.get("WEB_CONCURRENCY", 1))
+    CACHE_TYPE = environ.get("CACHE_TYPE", "simple")
+    CACHE_DIR = environ.get("CACHE_DIR", path.join(basedir, ".cache"))
+    CACHE_REDIS_URL = environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    PAGE_CACHE_TIMEOUT = 60
+    FRAGMENT_CACHE_TIMEOUT = 300
+    SIDEBAR_CACHE_TIMEOUT = 300
+    USER_CACHE_TIMEOUT = 60
+    SYNDICATION_ITEMS = 20
+    SYNDICATION_MAX_AGE = 300
+    TRANSFER_BATCH_SIZE = 1000
+    TRANSFER_UPLOAD_LIMIT = 50 * 1024 * 1024
+    # Background threads deleting accounts; 0 deletes within the request.
+    ACCOUNT_DELETE_WORKERS = int(environ.get("ACCOUNT_DELETE_WORKERS", 1))
+    ACCOUNT_DELETE_CHUNK = 500
+    TIMELINE_ENABLED = environ.get("TIMELINE_ENABLED") == "1"
+    TIMELINE_FANOUT_LIMIT = int(environ.get("TIMELINE_FANOUT_LIMIT", 1000))
     UPLOADED_PHOTOS_DEST = path.join(basedir, "Social_Blog/static/images")
+    PHOTO_STORAGE = "Social_Blog.storage:LocalStorage"
+    IMAGE_PENDING_DEST = path.join(basedir, "uploads")
+    IMAGE_WORKERS = int(environ.get("IMAGE_WORKERS", 2))
+    BCRYPT_LOG_ROUNDS = int(environ.get("BCRYPT_LOG_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS = int(environ.get("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_QUEUE = 8
+    PASSWORD_HASH_TIMEOUT = 10
+    # (attempts, seconds) allowed per client address and per account.
+    PASSWORD_RATE_LIMIT_IP = (30, 60)
+    PASSWORD_RATE_LIMIT_ACCOUNT = (5, 60)
+    METRICS_ENABLED = environ.get("METRICS_ENABLED") == "1"
+    METRICS_SAMPLE_RATE = float(environ.get("METRICS_SAMPLE_RATE", 1.0))
+    METRICS_TOKEN = environ.get("METRICS_TOKEN")
 
 
 class ProductionConfig(Config):
     DEBUG = False
     ENV = "production"
+    # Applied to SQLite databases only: readers no longer block the writer,
+    # commits skip the per-transaction fsync of the WAL, and a locked database
+    # is retried for a while instead of failing straight away.
+    SQLALCHEMY_SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(environ.get("SQLITE_BUSY_TIMEOUT", 15000)),
+    }
+    # Applied to server databases (Postgres, MySQL) only.
+    SQLALCHEMY_POOL_OPTIONS = {
+        "pool_size": int(environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": int(environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
@@ -1,6 +1,9 @@
+from os import environ
+
+from config import Config, ProductionConfig
 from Social_Blog import create_app
 
-app = create_app()
+app = create_app(ProductionConfig if environ.get("FLASK_ENV") == "production" else Config)
 
 if __name__=="__main__":
     app.run(debug=True)
\ No newline at end of file
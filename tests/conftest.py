@@ -0,0 +1,66 @@
+import pytest
+
+from benchmarks.data import PASSWORD, generate
+from benchmarks.harness import routes
+from config import Config
+from Social_Blog import cache, create_app, db
+from Social_Blog.models import Comment
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # The routes are registered on the first app created in the process, so
+    # every test shares this one.
+    database = tmp_path_factory.mktemp("db") / "test.db"
+
+    class TestConfig(Config):
+        SECRET_KEY = "test"
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+        SQLALCHEMY_BINDS = None
+        WTF_CSRF_ENABLED = False
+        CACHE_TYPE = "simple"
+        WEB_CONCURRENCY = 1
+        IMAGE_WORKERS = 0
+        PASSWORD_HASH_WORKERS = 0
+        ACCOUNT_DELETE_WORKERS = 0
+        MAIL_OUTBOX_THREAD = False
+        BCRYPT_LOG_ROUNDS = 4
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        generate(users=40, posts=200, comments=500, follows_per_user=8)
+    return app
+
+
+@pytest.fixture(scope="session")
+def paths(app):
+    with app.app_context():
+        viewer, paths = routes()
+        return viewer.email, dict(paths)
+
+
+@pytest.fixture(scope="session")
+def client(app, paths):
+    # Signed in once: repeated sign-ins would run into the rate limit.
+    email, _ = paths
+    client = app.test_client()
+    response = client.post("/login", data={"email": email, "password": PASSWORD})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def new_comments(client):
+    # Comments the signed-in client writes during the test are deleted after.
+    last = db.session.query(db.func.max(Comment.id)).scalar() or 0
+    yield
+    for comment in Comment.query.filter(Comment.id > last).all():
+        client.post(f"/{comment.post_id}/comment/{comment.id}/delete")
+
+
+@pytest.fixture(autouse=True)
+def cold_cache(app):
+    with app.app_context():
+        cache.clear()
+        yield
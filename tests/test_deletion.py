@@ -0,0 +1,155 @@
+import pytest
+
+from benchmarks.data import PASSWORD
+from Social_Blog import db, deletion, passwords
+from Social_Blog.deletion import STEPS
+from Social_Blog.images import rendition_names
+from Social_Blog.models import (Comment, Follow, ImageJob, Post, TimelineEntry,
+                                User)
+from Social_Blog.storage import LocalStorage
+
+
+def _stale_counters():
+    stale = []
+    for user in User.query:
+        stored = (
+            user.followers_count,
+            user.following_count,
+            user.post_count,
+            user.comment_count,
+        )
+        actual = (
+            Follow.query.filter_by(followed_id=user.id).count(),
+            Follow.query.filter_by(follower_id=user.id).count(),
+            Post.query.filter_by(user_id=user.id).count(),
+            Comment.query.filter_by(author_id=user.id).count(),
+        )
+        if stored != actual:
+            stale.append((user, stored, actual))
+    for post in Post.query:
+        actual = Comment.query.filter_by(post_id=post.id).count()
+        if post.comment_count != actual:
+            stale.append((post, post.comment_count, actual))
+    return stale
+
+
+@pytest.fixture
+def storage(app, tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setitem(app.extensions, "photo_storage", storage)
+    return storage
+
+
+@pytest.fixture
+def victim(app, paths, storage, monkeypatch):
+    # Small chunks, so every step takes several.
+    monkeypatch.setitem(app.config, "ACCOUNT_DELETE_CHUNK", 3)
+    email, urls = paths
+    # The writers the other tests' pages are about stay.
+    keep = {urls["post"].split("/")[1], urls["profile"].split("/")[1]}
+    victim = (
+        User.query.filter(
+            User.email != email,
+            ~User.username.in_(keep),
+            User.post_count > 0,
+            User.comment_count > 0,
+            User.followers_count > 0,
+        )
+        .order_by(User.id)
+        .first()
+    )
+    _attach_image(victim, storage, "0")
+    return victim
+
+
+@pytest.fixture
+def writer(storage, monkeypatch):
+    writer = User(
+        username="leaving",
+        email="leaving@example.com",
+        password=passwords.hash_password(PASSWORD),
+    )
+    db.session.add(writer)
+    db.session.commit()
+    _attach_image(writer, storage, "1")
+    user_id = writer.id
+    yield writer
+    left = User.query.get(user_id)
+    if left is not None:
+        monkeypatch.setattr(deletion, "STEPS", STEPS)
+        deletion.start(left)
+
+
+def _attach_image(user, storage, digit):
+    job = ImageJob(
+        basename=digit * 64, ext=".png", kind="attachment", user_id=user.id, status="done"
+    )
+    db.session.add(job)
+    db.session.commit()
+    for name in rendition_names(job.basename, job.ext):
+        with open(storage.path(name), "wb") as f:
+            f.write(b"image")
+
+
+def _sign_in(app, user):
+    client = app.test_client()
+    client.environ_base["REMOTE_ADDR"] = "198.51.100.1"
+    return client.post("/login", data={"email": user.email, "password": PASSWORD})
+
+
+@pytest.fixture
+def failing(monkeypatch):
+    # The images step fails after its deletes, in the same transaction.
+    def images(user_id, limit, stale):
+        deletion._images(user_id, limit, stale)
+        raise RuntimeError("storage is unavailable")
+
+    monkeypatch.setattr(deletion, "STEPS", (("images", images),))
+
+
+def test_deletion_removes_everything_and_keeps_counters(victim, storage):
+    user_id = victim.id
+    posts = [post.id for post in Post.query.filter_by(user_id=user_id)]
+    assert _stale_counters() == []
+
+    job = deletion.start(victim)
+
+    assert job.status == "done"
+    assert job.deleted > 0
+    assert User.query.get(user_id) is None
+    assert Post.query.filter_by(user_id=user_id).count() == 0
+    assert Comment.query.filter_by(author_id=user_id).count() == 0
+    assert Comment.query.filter(Comment.post_id.in_(posts)).count() == 0
+    assert Follow.query.filter(
+        (Follow.follower_id == user_id) | (Follow.followed_id == user_id)
+    ).count() == 0
+    assert TimelineEntry.query.filter_by(user_id=user_id).count() == 0
+    assert ImageJob.query.filter_by(user_id=user_id).count() == 0
+    assert not any(
+        storage.exists(name) for name in rendition_names("0" * 64, ".png")
+    )
+    assert _stale_counters() == []
+
+
+def test_failed_deletion_keeps_files_and_blocks_sign_in(
+    app, writer, storage, failing, monkeypatch
+):
+    user_id = writer.id
+    names = rendition_names("1" * 64, ".png")
+    job = deletion.start(writer)
+    assert job.status == "failed"
+    assert all(storage.exists(name) for name in names)
+    assert ImageJob.query.filter_by(user_id=user_id).count() == 1
+    assert _sign_in(app, writer).status_code == 200
+
+    monkeypatch.setattr(deletion, "STEPS", STEPS)
+    assert deletion.resume() == 1
+    assert not any(storage.exists(name) for name in names)
+    assert ImageJob.query.filter_by(user_id=user_id).count() == 0
+
+
+def test_cancelled_deletion_lets_the_writer_back_in(app, writer, failing):
+    assert deletion.start(writer).status == "failed"
+    assert deletion.cancel(writer.username) == 1
+    assert deletion.unfinished(writer.id) is None
+    assert _sign_in(app, writer).status_code == 302
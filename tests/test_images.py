@@ -0,0 +1,49 @@
+import io
+
+import pytest
+from PIL import Image
+
+from Social_Blog import images
+from Social_Blog.storage import LocalStorage
+
+
+@pytest.fixture
+def storage(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "IMAGE_PENDING_DEST", str(tmp_path / "pending"))
+    monkeypatch.setitem(
+        app.extensions, "photo_storage", LocalStorage(str(tmp_path / "images"))
+    )
+    return tmp_path
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), "teal").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_unreadable_upload_is_rejected(client, storage):
+    response = client.post(
+        "/upload",
+        data={"file": (io.BytesIO(b"not an image at all"), "photo.png")},
+    )
+    assert response.status_code == 400
+    assert not list((storage / "pending").rglob("*.*"))
+
+
+def test_upload_is_served(client, storage):
+    response = client.post("/upload", data={"file": (io.BytesIO(png()), "photo.png")})
+    assert response.status_code == 200
+    photo = client.get(response.get_json()["url"])
+    assert photo.status_code == 200
+    assert photo.mimetype == "image/png"
+
+
+def test_pending_upload_gets_a_placeholder(app, client, storage, monkeypatch):
+    monkeypatch.setattr(images, "dispatch", lambda job: None)
+    response = client.post("/upload", data={"file": (io.BytesIO(png()), "other.png")})
+    assert response.status_code == 200
+    photo = client.get(response.get_json()["url"])
+    assert photo.status_code == 200
+    assert photo.mimetype == "image/svg+xml"
+    assert photo.headers["Cache-Control"] == "no-store"
@@ -0,0 +1,111 @@
+import socketserver
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask_mail import Message
+
+from Social_Blog import db, outbox
+from Social_Blog.models import OutboxMessage
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib to hand over a message."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost ESMTP")
+        data = None
+        for line in self.rfile:
+            if data is not None:
+                if line == b".\r\n":
+                    self.server.messages.append(b"".join(data).decode("utf-8"))
+                    data = None
+                    self.reply("250 Queued")
+                else:
+                    data.append(line)
+                continue
+            verb = line[:4].upper()
+            if verb == b"DATA":
+                data = []
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif verb == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp(app, monkeypatch):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state = app.extensions["mail"]
+    monkeypatch.setattr(state, "server", "127.0.0.1")
+    monkeypatch.setattr(state, "port", server.server_address[1])
+    monkeypatch.setattr(state, "use_ssl", False)
+    monkeypatch.setattr(state, "use_tls", False)
+    monkeypatch.setattr(state, "username", None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def message(app):
+    OutboxMessage.query.delete()
+    db.session.commit()
+    outbox.enqueue(
+        Message(
+            "Password Reset Request",
+            sender="noreply@devwrites.xyz",
+            recipients=["reader@example.com"],
+            body="Follow the link to reset your password.",
+        )
+    )
+    return OutboxMessage.query.one()
+
+
+def test_delivers_over_smtp(smtp, message):
+    assert outbox.deliver_pending() == 1
+    assert len(smtp.messages) == 1
+    assert "Subject: Password Reset Request" in smtp.messages[0]
+    assert "Follow the link" in smtp.messages[0]
+    db.session.refresh(message)
+    assert message.sent_at is not None
+    assert message.claimed_by is None
+    assert outbox.deliver_pending() == 0
+    assert len(smtp.messages) == 1
+
+
+def test_skips_messages_claimed_by_another_consumer(app, smtp, message):
+    message.claimed_at = datetime.utcnow()
+    message.claimed_by = "other"
+    db.session.commit()
+    assert outbox.deliver_pending() == 0
+    assert smtp.messages == []
+
+    # The other consumer died; its claim runs out.
+    lease = timedelta(seconds=app.config["MAIL_OUTBOX_LEASE"] + 1)
+    message.claimed_at = datetime.utcnow() - lease
+    db.session.commit()
+    assert outbox.deliver_pending() == 1
+    assert len(smtp.messages) == 1
+
+
+def test_unreachable_server_backs_off(app, smtp, message, monkeypatch):
+    port = smtp.server_address[1]
+    smtp.shutdown()
+    smtp.server_close()
+    monkeypatch.setattr(app.extensions["mail"], "port", port)
+    assert outbox.deliver_pending() == 0
+    db.session.refresh(message)
+    assert message.attempts == 1
+    assert message.sent_at is None
+    assert message.claimed_by is None
+    assert message.next_attempt_at > datetime.utcnow()
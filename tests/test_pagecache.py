@@ -0,0 +1,32 @@
+from Social_Blog.models import Post
+
+
+def test_anonymous_page_is_cached_until_the_feed_changes(app, client, paths):
+    anonymous = app.test_client()
+    assert anonymous.get("/explore").headers["X-Cache"] == "MISS"
+    assert anonymous.get("/explore").headers["X-Cache"] == "HIT"
+
+    email, _ = paths
+    post = Post.query.filter(Post.author.has(email=email)).first()
+    title = post.title
+    response = client.post(
+        f"/{post.author.username}/{post.slug}/update",
+        data={"title": "Retitled for the cache", "content": post.content},
+    )
+    assert response.status_code == 302
+    try:
+        page = anonymous.get("/explore")
+        assert page.headers["X-Cache"] == "MISS"
+    finally:
+        client.post(
+            f"/{post.author.username}/{post.slug}/update",
+            data={"title": title, "content": post.content},
+        )
+
+
+def test_comments_fragment_follows_new_comments(client, paths, new_comments):
+    _, urls = paths
+    assert b"Seen straight away" not in client.get(urls["post"]).data
+    response = client.post(urls["post"], data={"body": "Seen straight away"})
+    assert response.status_code == 302
+    assert b"Seen straight away" in client.get(urls["post"]).data
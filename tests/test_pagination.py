@@ -0,0 +1,46 @@
+import pytest
+
+from Social_Blog.feeds import FEED_KEYS, explore_query
+from Social_Blog.models import Post
+from Social_Blog.pagination import (InvalidCursor, decode_cursor, encode_cursor,
+                                    keyset_paginate)
+
+
+def test_cursor_round_trips(app):
+    post = Post.query.first()
+    values = [post.date_posted, post.id]
+    assert decode_cursor(encode_cursor(values), FEED_KEYS) == values
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "not a cursor",
+        encode_cursor([1]),
+        encode_cursor(["yesterday", 1]),
+        encode_cursor({"id": 1}),
+    ],
+)
+def test_bad_cursors_are_rejected(app, token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, FEED_KEYS)
+
+
+def test_pages_walk_the_feed_once_in_order(app):
+    expected = [
+        post.id
+        for post in Post.query.order_by(Post.date_posted.desc(), Post.id.desc())
+    ]
+    seen, cursor = [], None
+    while True:
+        page = keyset_paginate(explore_query(), FEED_KEYS, cursor=cursor, per_page=7)
+        seen.extend(post.id for post in page.items)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert seen == expected
+
+
+def test_bad_cursor_is_a_bad_request(app):
+    response = app.test_client().get("/explore/more?cursor=garbage")
+    assert response.status_code == 400
@@ -0,0 +1,43 @@
+import pytest
+
+from Social_Blog.querycount import assert_max_queries
+
+# Statements a page may issue with nothing cached, however many posts,
+# comments or followers it lists: loading the viewer, checking their account
+# is not being deleted, and the page's own queries.
+BUDGETS = {
+    "home": 5,
+    "explore": 5,
+    "post": 5,
+    "profile": 5,
+    "followers": 5,
+}
+
+
+@pytest.mark.parametrize("name", BUDGETS)
+def test_page_query_budget(client, paths, name):
+    _, urls = paths
+    with assert_max_queries(BUDGETS[name]):
+        response = client.get(urls[name])
+    assert response.status_code == 200
+
+
+def test_followed_timeline_query_budget(client, paths):
+    _, urls = paths
+    client.get("/home/followed")
+    try:
+        with assert_max_queries(BUDGETS["home"]):
+            response = client.get(urls["home"])
+    finally:
+        client.get("/home/all")
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("name", BUDGETS)
+def test_cached_page_needs_fewer_queries(client, paths, name):
+    _, urls = paths
+    client.get(urls[name])
+    with assert_max_queries(BUDGETS[name]) as counter:
+        response = client.get(urls[name])
+    assert response.status_code == 200
+    assert counter.count < BUDGETS[name]
@@ -0,0 +1,41 @@
+import pytest
+
+from benchmarks.data import PASSWORD
+from Social_Blog import ratelimit
+
+
+@pytest.fixture(autouse=True)
+def buckets(app):
+    yield
+    ratelimit._buckets().clear()
+
+
+def _client(app, address):
+    client = app.test_client()
+    client.environ_base["REMOTE_ADDR"] = address
+    return client
+
+
+def _login(client, email, password="wrong password"):
+    return client.post("/login", data={"email": email, "password": password})
+
+
+def test_repeated_sign_ins_to_one_account_get_429(app):
+    capacity, _ = app.config["PASSWORD_RATE_LIMIT_ACCOUNT"]
+    client = _client(app, "203.0.113.1")
+    for _ in range(capacity):
+        assert _login(client, "writer1@example.com").status_code == 200
+
+    response = _login(client, "writer1@example.com", PASSWORD)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # Other accounts, from another address, are not held up.
+    assert _login(_client(app, "203.0.113.2"), "writer2@example.com").status_code == 200
+
+
+def test_one_address_is_limited_across_accounts(app):
+    capacity, _ = app.config["PASSWORD_RATE_LIMIT_IP"]
+    client = _client(app, "203.0.113.3")
+    for n in range(capacity):
+        assert _login(client, f"nobody{n}@example.com").status_code == 200
+    assert _login(client, "nobody@example.com").status_code == 429
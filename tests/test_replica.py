@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from Social_Blog import db
+from Social_Blog.database import REPLICA
+from Social_Blog.querycount import QueryCounter
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    # The same database under a second engine: what matters is which engine
+    # a read goes to.
+    monkeypatch.setitem(
+        app.config, "SQLALCHEMY_BINDS", {REPLICA: app.config["SQLALCHEMY_DATABASE_URI"]}
+    )
+    return db.get_engine(app, bind=REPLICA)
+
+
+def _get(client, path, replica):
+    with QueryCounter() as primary, QueryCounter(replica) as secondary:
+        response = client.get(path)
+    assert response.status_code == 200
+    return primary.count, secondary.count
+
+
+def test_feed_reads_go_to_the_replica(app, replica):
+    primary, secondary = _get(app.test_client(), "/explore", replica)
+    assert primary == 0
+    assert secondary > 0
+
+
+def test_recent_writer_reads_from_the_primary(app, replica):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_primary_until"] = time.time() + 60
+    primary, secondary = _get(client, "/explore", replica)
+    assert primary > 0
+    assert secondary == 0
+
+
+def test_a_write_keeps_the_writer_on_the_primary(client, paths, replica, new_comments):
+    _, urls = paths
+    with client.session_transaction() as session:
+        session.pop("_primary_until", None)
+    _, secondary = _get(client, "/home", replica)
+    assert secondary > 0
+
+    response = client.post(urls["post"], data={"body": "Read your own writes"})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session["_primary_until"] > time.time()
+    _, secondary = _get(client, "/home", replica)
+    assert secondary == 0
@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from Social_Blog import db, search
+from Social_Blog.models import Post, User
+
+
+@pytest.fixture
+def fallback(app, monkeypatch):
+    index = search.InvertedIndex()
+    monkeypatch.setitem(app.extensions, "search", index)
+    return index
+
+
+def _keys(query):
+    return {(hit.kind, hit.ref_id) for hit in search.search(query, per_page=1000).hits}
+
+
+def test_fts5_finds_posts_by_title_and_prefix():
+    post = Post.query.first()
+    word = search.tokenize(post.title)[0]
+    assert ("post", post.id) in _keys(word)
+    assert ("post", post.id) in _keys(word[:-1])
+
+
+def test_fallback_applies_changes_only_once_committed(fallback):
+    search.search("flask")
+    author = User.query.first()
+    post = Post(title="Zyzzyva sightings", content="<div>rare</div>", author=author)
+    post.create_slug()
+    db.session.add(post)
+    db.session.flush()
+    search.index_post(post)
+    assert _keys("zyzzyva") == set()
+    db.session.rollback()
+    assert _keys("zyzzyva") == set()
+
+    post = Post(title="Zyzzyva sightings", content="<div>rare</div>", author=author)
+    post.create_slug()
+    db.session.add(post)
+    db.session.flush()
+    search.index_post(post)
+    db.session.commit()
+    try:
+        assert _keys("zyzzyva") == {("post", post.id)}
+    finally:
+        search.remove_post(post)
+        db.session.delete(post)
+        db.session.commit()
+    assert _keys("zyzzyva") == set()
+
+
+def test_fallback_load_is_retried_after_a_failure(fallback, monkeypatch):
+    def broken(documents):
+        raise OperationalError(None, None, "lost connection")
+
+    monkeypatch.setattr(fallback, "_add", broken)
+    with pytest.raises(OperationalError):
+        search.search("flask")
+    monkeypatch.undo()
+    assert not fallback._loaded
+    assert search.search("flask").total > 0
+
+
+def test_fallback_only_matches_the_last_term_as_a_prefix(fallback):
+    fallback._loaded = True
+    fallback._add(
+        [
+            ("post", 1, 1, "Flask python", ""),
+            ("post", 2, 2, "Flasks python", ""),
+        ]
+    )
+    results = search.search("flask pyth")
+    assert [hit.ref_id for hit in results.hits] == [1]
+    assert "<mark>Flask</mark>" in results.hits[0].title
+
+
+def test_fallback_is_refused_with_several_workers(app, monkeypatch):
+    def no_fts5():
+        raise OperationalError(None, None, "no such module: fts5")
+
+    monkeypatch.setattr(search, "Fts5Index", no_fts5)
+    monkeypatch.delitem(app.extensions, "search")
+    monkeypatch.setitem(app.config, "WEB_CONCURRENCY", 2)
+    with pytest.raises(RuntimeError):
+        search.get_index()
+    monkeypatch.setitem(app.config, "WEB_CONCURRENCY", 1)
+    assert isinstance(search.get_index(), search.InvertedIndex)
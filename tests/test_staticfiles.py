@@ -0,0 +1,28 @@
+import os
+
+from flask import Flask
+
+from Social_Blog.staticfiles import MANIFEST, Assets, build
+
+
+def test_build_fingerprints_and_compresses(app, tmp_path):
+    manifest = build(app.static_folder, str(tmp_path))
+    assert manifest
+    for name, built in manifest.items():
+        assert built != name
+        assert (tmp_path / built).exists()
+    assert (tmp_path / MANIFEST).exists()
+    assert any(name.endswith(".gz") for name in os.listdir(tmp_path / "css"))
+    assert build(app.static_folder, str(tmp_path)) == manifest
+
+
+def test_app_only_loads_the_manifest(tmp_path):
+    app = Flask("Social_Blog")
+    app.config["ASSETS_DIST"] = str(tmp_path / "dist")
+    assets = Assets(app)
+    assert assets.manifest == {}
+    assert not (tmp_path / "dist").exists()
+
+    build(app.static_folder, app.config["ASSETS_DIST"])
+    assets.load()
+    assert assets.manifest
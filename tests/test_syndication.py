@@ -0,0 +1,49 @@
+from Social_Blog import syndication
+from Social_Blog.models import Post, User
+
+
+def _get(client, path, etag=None):
+    headers = {"If-None-Match": etag} if etag else {}
+    response = client.get(path, headers=headers)
+    response.close()
+    return response
+
+
+def _writers():
+    # Two writers with posts, so each has a feed of its own.
+    ids = [row[0] for row in Post.query.with_entities(Post.user_id).distinct().limit(2)]
+    return [User.query.get(ident) for ident in ids]
+
+
+def test_unchanged_feed_is_not_modified(app):
+    client = app.test_client()
+    first = _get(client, "/feed.xml")
+    assert first.status_code == 200
+    assert first.headers["ETag"]
+
+    again = _get(client, "/feed.xml", first.headers["ETag"])
+    assert again.status_code == 304
+    assert again.data == b""
+
+
+def test_only_the_changed_writers_feed_is_revalidated(app):
+    client = app.test_client()
+    writer, other = _writers()
+    paths = [f"/{writer.username}/feed.atom", f"/{other.username}/feed.atom", "/feed.atom"]
+    etags = {path: _get(client, path).headers["ETag"] for path in paths}
+
+    syndication.invalidate(writer.id)
+
+    statuses = {path: _get(client, path, etags[path]).status_code for path in paths}
+    assert statuses == {paths[0]: 200, paths[1]: 304, paths[2]: 200}
+
+
+def test_invalidate_all_changes_every_feed(app):
+    client = app.test_client()
+    writer, _ = _writers()
+    paths = [f"/{writer.username}/feed.json", "/feed.json"]
+    etags = {path: _get(client, path).headers["ETag"] for path in paths}
+
+    syndication.invalidate_all()
+
+    assert all(_get(client, path, etags[path]).status_code == 200 for path in paths)
@@ -0,0 +1,79 @@
+import pytest
+
+from Social_Blog import db, timeline
+from Social_Blog.feeds import followed_union
+from Social_Blog.models import Follow, Post, TimelineEntry, User
+
+
+def _ids(query):
+    return [post.id for post in query.order_by(None).all()]
+
+
+def _inbox_feed(user):
+    query, _ = timeline.feed_query(user)
+    return sorted(_ids(query))
+
+
+def _union_feed(user):
+    query, _ = followed_union(user)
+    return sorted(_ids(query))
+
+
+@pytest.fixture
+def fanout(app, monkeypatch):
+    popular = User.query.order_by(User.followers_count.desc(), User.id).first()
+    monkeypatch.setitem(app.config, "TIMELINE_ENABLED", True)
+    # Only the most followed writer is over the limit.
+    monkeypatch.setitem(
+        app.config, "TIMELINE_FANOUT_LIMIT", popular.followers_count - 1
+    )
+    timeline.rebuild()
+    yield popular
+    created = Post.query.filter(Post.title == "Fresh off the press").all()
+    for post in created:
+        TimelineEntry.query.filter_by(post_id=post.id).delete()
+        db.session.delete(post)
+    User.query.update({User.fanout_skipped: False})
+    db.session.commit()
+
+
+def test_inbox_feed_matches_union_feed(fanout):
+    followers = [
+        f.follower for f in Follow.query.filter_by(followed_id=fanout.id).limit(5)
+    ]
+    loners = User.query.filter(User.following_count == 0).limit(2).all()
+    assert followers
+    for user in followers + loners:
+        assert _inbox_feed(user) == _union_feed(user)
+    assert User.query.get(fanout.id).fanout_skipped
+
+
+def _publish(author):
+    post = Post(title="Fresh off the press", content="<div>news</div>", author=author)
+    post.create_slug()
+    db.session.add(post)
+    db.session.flush()
+    timeline.fan_out(post)
+    db.session.commit()
+    return post
+
+
+def test_posts_stay_when_author_drops_under_the_limit(app, fanout, monkeypatch):
+    follower = Follow.query.filter_by(followed_id=fanout.id).first().follower
+    skipped = _publish(fanout)
+    assert TimelineEntry.query.filter_by(post_id=skipped.id).count() == 1
+    assert skipped.id in _inbox_feed(follower)
+
+    monkeypatch.setitem(app.config, "TIMELINE_FANOUT_LIMIT", fanout.followers_count)
+    assert _inbox_feed(follower) == _union_feed(follower)
+
+    # The next post writes everything that was skipped into the inboxes.
+    fresh = _publish(fanout)
+    author = User.query.get(fanout.id)
+    db.session.refresh(author)
+    assert not author.fanout_skipped
+    assert TimelineEntry.query.filter_by(post_id=skipped.id).count() == (
+        author.followers_count + 1
+    )
+    assert fresh.id in _inbox_feed(follower)
+    assert _inbox_feed(follower) == _union_feed(follower)
@@ -0,0 +1,68 @@
+import json
+
+from Social_Blog import db, passwords, transfer
+from Social_Blog.models import Comment, Post, User
+
+
+def _lines(records):
+    return [json.dumps(record) + "\n" for record in records]
+
+
+def test_account_export_imports_back_as_nothing_new(client, paths):
+    email, _ = paths
+    user = User.query.filter_by(email=email).one()
+    posts = Post.query.filter_by(user_id=user.id).count()
+    body = client.get("/account/export").data
+    assert body.count(b'"type": "post"') == posts
+
+    response = client.post(
+        "/account/import", data=body, content_type="application/x-ndjson"
+    )
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == {}
+    assert Post.query.filter_by(user_id=user.id).count() == posts
+
+
+def test_full_dump_imports_back_as_nothing_new(app):
+    counts = (User.query.count(), Post.query.count(), Comment.query.count())
+    lines = list(transfer.export_lines())
+    summary = transfer.Importer().feed(lines).finish()
+    assert summary["imported"] == {}
+    assert (User.query.count(), Post.query.count(), Comment.query.count()) == counts
+
+
+def test_taken_slug_is_renamed_and_keeps_its_comments(app):
+    other = Post.query.first()
+    records = [
+        dict(type="user", username="incomer", email="incomer@example.com"),
+        dict(type="post", author="incomer", title="Clash", slug=other.slug),
+        dict(
+            type="comment",
+            post=other.slug,
+            post_author="incomer",
+            author="incomer",
+            body="First!",
+        ),
+    ]
+    transfer.Importer().feed(_lines(records)).finish()
+    incomer = User.query.filter_by(username="incomer").one()
+    post = Post.query.filter_by(user_id=incomer.id).one()
+    assert post.slug != other.slug
+    assert [c.body for c in Comment.query.filter_by(post_id=post.id)] == ["First!"]
+    assert Comment.query.filter_by(post_id=other.id, body="First!").count() == 0
+
+
+def test_unreadable_password_hash_is_replaced(app):
+    records = [
+        dict(
+            type="user",
+            username="badhash",
+            email="badhash@example.com",
+            password="not-a-bcrypt-hash",
+        )
+    ]
+    transfer.Importer().feed(_lines(records)).finish()
+    user = User.query.filter_by(username="badhash").one()
+    assert passwords.is_hash(user.password)
+    assert not passwords.verify(user, "not-a-bcrypt-hash")
+    db.session.rollback()